@@ -0,0 +1,113 @@
+""" Benchmark `decide_indexed` against merge based `decide_before_insert`
+
+Usage:
+    python3 benchmarks/bench_decision.py [--sizes 10000 100000 1000000]
+"""
+import argparse
+import filecmp
+import logging
+import os.path as op
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, op.join(op.dirname(op.abspath(__file__)),
+                           op.pardir, "updater"))
+import updater.inserter as inserter
+from updater.inserter import decide_before_insert, decide_indexed
+from updater.schema import products_frame, memory_mb
+
+LOGS = ["skip_rows", "insert_rows", "update_rows"]
+
+def synthetic_frames(n_rows, seed=0):
+    """
+    `products` with `n_rows` rows and `update` with `n_rows` rows:
+    existing rows (some with new prices), new rows, rows with only one
+    of `REFERENCE` / `CODE` matching and new rows reusing a `NAME`
+    """
+    rnd = np.random.RandomState(seed)
+    reference = 10 ** 7 + 13 * rnd.permutation(n_rows)
+    code = 4000000000000 + 7 * rnd.permutation(n_rows)
+    names = np.array(["Wolle %d %04d" % (i // 20, i % 10000)
+                      for i in range(n_rows)], dtype=object)
+    # Some names twice in products
+    twice = np.arange(0, n_rows - 1, 50)
+    names[twice] = names[twice + 1]
+    products = pd.DataFrame({
+        "REFERENCE": reference,
+        "CODE":      code,
+        "NAME":      names,
+        "PRICEBUY":  rnd.randint(100, 2000, n_rows) / 100.,
+        "PRICESELL": rnd.randint(200, 4000, n_rows) / 100.,
+    })
+
+    update = products.sample(frac=1., random_state=seed)\
+        .reset_index(drop=True)
+    kind = rnd.randint(0, 10, n_rows)
+    changed = kind < 3
+    update.loc[changed, "PRICEBUY"] += 0.5
+    new = (kind >= 5) & (kind < 8)
+    update.loc[new, "REFERENCE"] += 10 ** 8
+    update.loc[new, "CODE"] += 10 ** 10
+    update.loc[new, "NAME"] = update.loc[new, "NAME"] + " neu"
+    mismatch = kind == 8
+    update.loc[mismatch, "CODE"] += 10 ** 10
+    renamed = kind == 9
+    update.loc[renamed, "REFERENCE"] += 10 ** 8
+    update.loc[renamed, "CODE"] += 10 ** 10
+    update["CODE"] = update["CODE"].astype("Int64")
+    update["rrp"] = update["PRICESELL"] * 1.19
+    return update, products_frame(products)
+
+def same_frames(left, right):
+    """ Equal values & dtypes, whatever the block layout """
+    try:
+        pd.testing.assert_frame_equal(left, right)
+    except AssertionError:
+        return False
+    return True
+
+def run(decide, update, products, folder):
+    """ Result & logs of `decide`, seconds without writing logs """
+    paths = {name: op.join(folder, name + ".csv") for name in LOGS}
+    result = decide(update.copy(), products, paths)
+
+    log_data, inserter.log_data = inserter.log_data, lambda *args: None
+    try:
+        start = time.perf_counter()
+        decide(update.copy(), products, paths)
+        elapsed = time.perf_counter() - start
+    finally:
+        inserter.log_data = log_data
+    return result, elapsed, paths
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[10000, 100000, 1000000])
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    print("%10s%15s%15s%10s%15s" % ("Rows", "Merges, s", "Indexed, s",
+                                    "Same", "Products, MB"))
+    for n_rows in args.sizes:
+        update, products = synthetic_frames(n_rows)
+        with tempfile.TemporaryDirectory() as merged_dir, \
+                tempfile.TemporaryDirectory() as indexed_dir:
+            expected, merged, merged_paths = run(
+                decide_before_insert, update, products, merged_dir)
+            result, indexed, indexed_paths = run(
+                decide_indexed, update, products, indexed_dir)
+
+            same = same_frames(expected, result) and all(
+                filecmp.cmp(merged_paths[name], indexed_paths[name],
+                            shallow=False)
+                for name in LOGS if op.exists(merged_paths[name]))
+        print("%10d%15.2f%15.2f%10s%15.1f" % (n_rows, merged, indexed, same,
+                                              memory_mb(products)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+""" Benchmark `parse_konto` pattern engine against the `iterrows` loop
+
+Usage:
+    python3 benchmarks/bench_matcher.py [--rules 500] [--texts 20000]
+    python3 benchmarks/bench_matcher.py --patterns parse_konto/patterns.xlsx
+"""
+import argparse
+import os.path as op
+import random
+import re
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, op.join(op.dirname(op.abspath(__file__)),
+                           op.pardir, "parse_konto"))
+from matcher import compile_patterns, find_rule, required_keyword
+
+WORDS = ["MIETE", "GEHALT", "LASTSCHRIFT", "SEPA", "KARTENZAHLUNG",
+         "TELEKOM", "VODAFONE", "AMAZON", "REWE", "EDEKA", "STROM",
+         "VERSICHERUNG", "FINANZAMT", "ZINSEN", "GUTSCHRIFT", "DAUERAUFTRAG"]
+
+def synthetic_patterns(n_rules, seed=0):
+    """ Mix of literal, wildcard, case insensitive & alternation rules """
+    rnd = random.Random(seed)
+    regexes = []
+    for i in range(n_rules):
+        word = "%s %d" % (rnd.choice(WORDS), i)
+        kind = rnd.random()
+        if kind < 0.7:
+            regexes.append(word)
+        elif kind < 0.8:
+            regexes.append(word.replace(" ", ".*"))
+        elif kind < 0.9:
+            regexes.append("(?i)" + word.lower())
+        else:
+            regexes.append("%s|%s" % (word, rnd.choice(WORDS)))
+    return pd.DataFrame({"Regex": regexes})
+
+def synthetic_texts(patterns, n_texts, seed=0):
+    """ Texts containing keywords of random rules plus noise """
+    rnd = random.Random(seed)
+    keywords = [required_keyword(regex) or rnd.choice(WORDS)
+                for regex in patterns["Regex"]]
+    texts = []
+    for _ in range(n_texts):
+        parts = [rnd.choice(keywords) if rnd.random() < 0.5 else
+                 "%s %d" % (rnd.choice(WORDS), rnd.randrange(10 ** 6))
+                 for _ in range(4)]
+        texts.append(" ".join(parts))
+    return texts
+
+def legacy_find(patterns, text):
+    """ Matching loop of the original `do_regex` """
+    for _, item in patterns.iterrows():
+        if re.search(item["Regex"], text):
+            return item["Regex"]
+    return None
+
+def timed(func, texts):
+    start = time.perf_counter()
+    result = [func(text) for text in texts]
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--patterns", help="`patterns.xlsx` to use")
+    parser.add_argument("--rules", type=int, default=500)
+    parser.add_argument("--texts", type=int, default=20000)
+    parser.add_argument("--legacy-texts", type=int, default=500,
+                        help="texts for the slow `iterrows` loop")
+    args = parser.parse_args()
+
+    if args.patterns:
+        patterns = pd.read_excel(args.patterns).fillna("")
+    else:
+        patterns = synthetic_patterns(args.rules)
+    texts = synthetic_texts(patterns, args.texts)
+
+    start = time.perf_counter()
+    engine = compile_patterns(patterns.to_dict("records"))
+    build = time.perf_counter() - start
+
+    def engine_find(text):
+        rule = find_rule(engine, text)
+        return None if rule is None else rule["Regex"]
+
+    found, elapsed = timed(engine_find, texts)
+    sample = texts[:args.legacy_texts]
+    expected, legacy_elapsed = timed(
+        lambda text: legacy_find(patterns, text), sample)
+    assert found[:len(sample)] == expected, "Engine differs from loop"
+
+    print("%-30s%d" % ("Rules:", patterns.shape[0]))
+    print("%-30s%d" % ("Rules without keyword:", len(engine["always"])))
+    print("%-30s%.3f s" % ("Engine build:", build))
+    print("%-30s%.1f us/text" % ("Engine:", 1e6 * elapsed / len(texts)))
+    print("%-30s%.1f us/text" %
+          ("Legacy loop:", 1e6 * legacy_elapsed / len(sample)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+""" Full `parse_konto` & `updater` runs on synthetic data
+
+Usage:
+    python3 benchmarks/bench_pipelines.py [--bank-rows 100000]
+        [--update-rows 100000] [--products-rows 200000] [--chunksize N]
+        [--overlap] [--regex-workers N] [--url URL] [--label NAME]
+        [--compare [RESULT]]
+
+The updater works on a SQLite database in a temporary folder, or on
+any SQLAlchemy `--url` (e.g. a local MariaDB, never `openbravopos`),
+filled by `generate.products_tables`. Stage reports of both runs are
+saved into `benchmarks/results/<date>[_<label>].json`, `--compare`
+prints stage times next to an earlier result (default: the latest).
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import os.path as op
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+BENCH   = op.dirname(op.abspath(__file__))
+ROOT    = op.abspath(op.join(BENCH, op.pardir))
+RESULTS = op.join(BENCH, "results")
+sys.path[:0] = [BENCH, op.join(ROOT, "parse_konto"), op.join(ROOT, "updater")]
+from generate import bank_export, bank_patterns, supplier_update, \
+    products_tables
+
+TABLES = {
+    "categories": """CREATE TABLE categories (
+        ID VARCHAR(255) NOT NULL PRIMARY KEY
+        , NAME VARCHAR(255) NOT NULL UNIQUE)""",
+    "products": """CREATE TABLE products (
+        ID VARCHAR(255) NOT NULL PRIMARY KEY
+        , REFERENCE VARCHAR(255) NOT NULL UNIQUE
+        , CODE VARCHAR(255) UNIQUE
+        , NAME VARCHAR(255) NOT NULL UNIQUE
+        , PRICEBUY DOUBLE NOT NULL
+        , PRICESELL DOUBLE NOT NULL
+        , CATEGORY VARCHAR(255) NOT NULL
+        , TAXCAT VARCHAR(255) NOT NULL
+        , ISCOM BIT NOT NULL
+        , ISSCALE BIT NOT NULL)""",
+}
+
+def run_parse_konto(work, n_rows, seed=0, chunksize=None,
+                    regex_workers=1):
+    """ Stage report of `parse_konto` on a synthetic bank export """
+    import parse_konto as pk
+    from matcher import compile_patterns
+    from memo import patterns_fingerprint
+    from patterns import COLUMNS
+
+    records = bank_patterns(300, seed)[COLUMNS].to_dict("records")
+    pk.ENGINE = compile_patterns(records)
+    pk.ENGINE["fingerprint"] = patterns_fingerprint(records)
+    pk.ROOT = work
+
+    os.makedirs(op.join(work, "input"), exist_ok=True)
+    path = op.join(work, "input", "bank.csv")
+    with open(path, "w", encoding=pk.ENCODING) as f:
+        f.write(bank_export(n_rows, seed))
+    # `parse_konto` prints every shortened text
+    with contextlib.redirect_stdout(io.StringIO()):
+        pk.reported_process_file(path, chunksize,
+                                 regex_workers=regex_workers)
+    with open(op.join(work, "logging", "bank_report.json")) as f:
+        return json.load(f)
+
+def fill_database(products, categories):
+    """ Recreates `products` & `categories` with generated rows """
+    from updater.db_connect import transaction, insert, \
+        PRODUCT_COLUMNS
+
+    with transaction() as cnx:
+        cursor = cnx.cursor()
+        for table, create in TABLES.items():
+            cursor.execute("DROP TABLE IF EXISTS %s" % table)
+            cursor.execute(create)
+        cursor.close()
+        insert(categories[["ID", "NAME"]], "categories", cnx=cnx)
+        insert(products[PRODUCT_COLUMNS], "products", cnx=cnx)
+
+def run_updater(work, url, n_update, n_products, seed=0, chunksize=None,
+                overlap=False):
+    """ Stage report of the updater applying a synthetic supplier file """
+    if "openbravopos" in url:
+        raise ValueError("Benchmarks overwrite `products`, "
+                         "use a separate database")
+    from updater.db_connect import configure, DEFAULTS
+
+    configure(dict(DEFAULTS, DATABASE_URL=url))
+    # `updater` writes logs into working dir
+    os.chdir(work)
+
+    update = supplier_update(n_update, seed)
+    products, categories = products_tables(update, n_products, seed)
+    fill_database(products, categories)
+    os.makedirs("input", exist_ok=True)
+    update.to_csv(op.join("input", "update.csv"), sep=";", index=False,
+                  encoding="cp1252")
+
+    import main
+    from updater.db_connect import dialect
+
+    # Chunked runs decide in MySQL
+    main.run(op.join("input", "update.csv"),
+             chunksize=chunksize if dialect() == "mysql" else None,
+             overlap=overlap)
+    with open(op.join("logging", "update_log", "run_report.json")) as f:
+        return json.load(f)
+
+def add_throughput(report):
+    """ Rows per second of each stage """
+    for record in report["stages"].values():
+        rows = record["rows_in"] or record["rows_out"]
+        record["rows_per_s"] = rows / record["seconds"] \
+            if rows and record["seconds"] else None
+    return report
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def save_result(result, label=None):
+    """ Saves result into `results`, returns path """
+    os.makedirs(RESULTS, exist_ok=True)
+    name = time.strftime("%Y%m%d_%H%M%S") + ("_" + label if label else "")
+    path = op.join(RESULTS, name + ".json")
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
+    return path
+
+def latest_result(exclude):
+    """ Path of the most recent saved result other than `exclude` """
+    files = sorted(file for file in os.listdir(RESULTS)
+                   if file.endswith(".json") and
+                   op.join(RESULTS, file) != exclude)
+    return op.join(RESULTS, files[-1]) if files else None
+
+def compare(result, path):
+    """ Prints stage seconds of `result` next to saved result at `path` """
+    with open(path) as f:
+        previous = json.load(f)
+    print("\nCompared with %s (%s)" % (op.basename(path),
+                                       previous.get("commit")))
+    print("%-30s%12s%12s%10s" % ("Stage", "Before, s", "Now, s", "Change"))
+    for pipeline in ("parse_konto", "updater"):
+        before = previous.get(pipeline, {}).get("stages", {})
+        for name, record in result[pipeline]["stages"].items():
+            old = before.get(name, {}).get("seconds")
+            change = "%+.0f %%" % (100. * (record["seconds"] / old - 1)) \
+                if old else ""
+            print("%-30s%12s%12.2f%10s" % ("%s %s" % (pipeline, name),
+                "%.2f" % old if old is not None else "-",
+                record["seconds"], change))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--bank-rows", type=int, default=100000)
+    parser.add_argument("--update-rows", type=int, default=100000)
+    parser.add_argument("--products-rows", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunksize", type=int, default=None)
+    parser.add_argument("--overlap", action="store_true",
+                        help="updater fetches & logs in threads")
+    parser.add_argument("--regex-workers", type=int, default=1,
+                        help="parse_konto classification processes")
+    parser.add_argument("--url", help="SQLAlchemy URL of the database "
+                                      "(default: temporary SQLite file)")
+    parser.add_argument("--label", help="added to the result filename")
+    parser.add_argument("--compare", nargs="?", const="latest",
+                        metavar="RESULT",
+                        help="result to compare with (default: latest)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    params = {key: value for key, value in vars(args).items()
+              if key not in ("compare", "label")}
+    result = {
+        "commit":   git_commit(),
+        "date":     time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python":   platform.python_version(),
+        "pandas":   pd.__version__,
+        "platform": platform.platform(),
+        "params":   params,
+    }
+    with tempfile.TemporaryDirectory() as work:
+        url = args.url or "sqlite:///" + op.join(work, "bench.db")
+        result["parse_konto"] = add_throughput(run_parse_konto(
+            work, args.bank_rows, args.seed, args.chunksize,
+            args.regex_workers))
+        result["updater"] = add_throughput(run_updater(
+            work, url, args.update_rows, args.products_rows, args.seed,
+            args.chunksize, args.overlap))
+        os.chdir(ROOT)
+
+    path = save_result(result, args.label)
+    print("%-30s%12s%12s%14s" % ("Stage", "Rows", "Seconds", "Rows / s"))
+    for pipeline in ("parse_konto", "updater"):
+        for name, record in result[pipeline]["stages"].items():
+            print("%-30s%12s%12.2f%14s" % ("%s %s" % (pipeline, name),
+                record["rows_in"] or record["rows_out"] or "",
+                record["seconds"], "%.0f" % record["rows_per_s"]
+                if record["rows_per_s"] else ""))
+    print("Saved `%s`" % op.relpath(path, ROOT))
+
+    if args.compare:
+        previous = latest_result(path) if args.compare == "latest" \
+            else args.compare
+        if previous:
+            compare(result, previous)
+        else:
+            print("No earlier result to compare with")
+
+if __name__ == "__main__":
+    main()
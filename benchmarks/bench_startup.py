@@ -0,0 +1,67 @@
+""" Startup cost of the entry points, measured with `-X importtime`
+
+Usage:
+    python3 benchmarks/bench_startup.py [--max-ms 150]
+
+Imports `updater/main.py` and `parse_konto/parse_konto.py` in fresh
+interpreters and runs both with `--help`. Fails (exit code 1) if one of
+them imports a heavy module at startup or takes longer than `--max-ms`.
+"""
+import argparse
+import os.path as op
+import subprocess
+import sys
+import time
+
+ROOT = op.abspath(op.join(op.dirname(op.abspath(__file__)), op.pardir))
+ENTRY_POINTS = {
+    "updater":     (op.join(ROOT, "updater"), "main"),
+    "parse_konto": (op.join(ROOT, "parse_konto"), "parse_konto"),
+}
+# Modules which should load only when a file is processed
+HEAVY = ("numpy", "pandas", "sqlalchemy", "yaml", "pyarrow", "openpyxl",
+         "pymysql")
+
+def import_times(folder, module):
+    """ {module: cumulative microseconds} of importing `module` """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import %s" % module],
+        cwd=folder, capture_output=True, text=True, check=True)
+    times = dict()
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+def help_seconds(folder, module):
+    """ Wall time of `python module.py --help` """
+    start = time.perf_counter()
+    subprocess.run([sys.executable, module + ".py", "--help"], cwd=folder,
+                   capture_output=True, check=True)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--max-ms", type=float, default=150.,
+                        help="allowed import time of an entry point")
+    args = parser.parse_args()
+
+    print("%-15s%12s%12s  %s" % ("Entry point", "Import, ms", "--help, ms",
+                                 "Heavy modules"))
+    failed = False
+    for name, (folder, module) in ENTRY_POINTS.items():
+        times = import_times(folder, module)
+        heavy = sorted(set(times) & set(HEAVY))
+        import_ms = times.get(module, 0) / 1000.
+        help_ms = help_seconds(folder, module) * 1000.
+        print("%-15s%12.1f%12.1f  %s" % (name, import_ms, help_ms,
+                                         ", ".join(heavy) or "-"))
+        failed |= bool(heavy) or import_ms > args.max_ms
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+""" Synthetic input data for the benchmarks
+
+Usage:
+    python3 benchmarks/generate.py DIR [--bank-rows 100000]
+        [--update-rows 100000] [--products-rows 200000] [--seed 0]
+
+Writes into DIR:
+    bank.csv                        - bank export (`parse_konto` input)
+    update.csv                      - supplier file (`updater` input)
+    products.csv & categories.csv   - tables the update is applied to
+"""
+import argparse
+import os
+import os.path as op
+import sys
+import uuid
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, op.dirname(op.abspath(__file__)))
+from bench_matcher import synthetic_patterns, synthetic_texts
+
+BANK_HEADER = ["Buchungstag", "Wert", "Umsatzart",
+               "Begünstigter / Auftraggeber", "Verwendungszweck",
+               "Kundenreferenz", "Mandatsreferenz", "Gläubiger ID",
+               "Soll", "Haben", "Währung"]
+# Rows of every group: `id` is `product_group` * 10000 + `colorn`
+COLORS = 60
+
+def german_amount(values):
+    """ Amounts as `1.234,56` """
+    return ["{:,.2f}".format(value).replace(",", " ")
+            .replace(".", ",").replace(" ", ".") for value in values]
+
+def bank_export(n_rows, seed=0, n_rules=300):
+    """
+    Text of a bank export with `n_rows` bookings, as exported: four
+    lines before the header, `Kontostand` lines, German amounts.
+    Texts contain keywords of `bank_patterns(n_rules, seed)`.
+    """
+    rnd = np.random.RandomState(seed)
+    days = pd.Timestamp("2019-01-01") + \
+        pd.to_timedelta(rnd.randint(0, 365, n_rows), unit="D")
+    dates = days.strftime("%d.%m.%Y")
+
+    texts = np.array(synthetic_texts(bank_patterns(n_rules, seed), n_rows,
+                                     seed), dtype=object)
+    # Card payments with terminal reference, a few overlong texts
+    ec = rnd.rand(n_rows) < 0.05
+    texts[ec] = ["Electronic Cash Einreichung TERMINAL 680930742%s%06d"
+                 % (day.strftime("%y%m%d"), number) for day, number in
+                 zip(days[ec], rnd.randint(0, 10 ** 6, ec.sum()))]
+    long = rnd.rand(n_rows) < 0.01
+    texts[long] = texts[long] + " " + "X" * 200
+
+    amounts = german_amount(rnd.randint(1, 500000, n_rows) / 100.)
+    debit = rnd.rand(n_rows) < 0.6
+    data = pd.DataFrame({
+        "Buchungstag": dates,
+        "Wert": dates,
+        "Umsatzart": np.array(["Lastschrift", "Gutschrift", "Kartenzahlung",
+                               ""])[rnd.randint(0, 4, n_rows)],
+        "Begünstigter / Auftraggeber": np.array(
+            ["Stadtwerke", "Telekom", 'Firma "Nord"', ""])[
+            rnd.randint(0, 4, n_rows)],
+        "Verwendungszweck": texts,
+        "Kundenreferenz": np.where(rnd.rand(n_rows) < 0.3, "KREF", ""),
+        "Mandatsreferenz": "",
+        "Gläubiger ID": "",
+        "Soll": np.where(debit, ["-" + a for a in amounts], ""),
+        "Haben": np.where(debit, "", amounts),
+        "Währung": "EUR",
+    }, columns=BANK_HEADER)
+    # Balance line every 1000 bookings
+    balance = data.iloc[::1000].copy()
+    balance.iloc[:, :] = ""
+    balance["Buchungstag"], balance["Währung"] = "Kontostand", "EUR"
+    data = pd.concat([data, balance]).sort_index(kind="mergesort")
+
+    lines = ["Umsatzanzeige;", "Konto;", "Zeitraum;", ";",
+             ";".join(BANK_HEADER)]
+    body = data.to_csv(sep=";", index=False, header=False)
+    return "\n".join(lines) + "\n" + body
+
+def bank_patterns(n_rules, seed=0):
+    """ Records of `patterns.xlsx` rows for `bank_export` texts """
+    rnd = np.random.RandomState(seed)
+    patterns = synthetic_patterns(n_rules, seed)
+    patterns["Konto"] = 1000 + rnd.randint(0, 8000, n_rules)
+    patterns["BU"] = np.where(rnd.rand(n_rules) < 0.2, "9", "")
+    patterns["Gegenkonto"] = 1000 + rnd.randint(0, 8000, n_rules)
+    patterns["IF regex 1"] = np.where(rnd.rand(n_rules) < 0.1,
+                                      "[0-9]{4,}", "")
+    patterns["IF substitute 1"] = np.where(patterns["IF regex 1"] != "",
+                                           "NR", "")
+    patterns["IF regex 2"] = ""
+    patterns = pd.concat([patterns, pd.DataFrame([{"Regex": ".*",
+        "Konto": 1800, "BU": "", "Gegenkonto": 1360, "IF regex 1": "",
+        "IF substitute 1": "", "IF regex 2": ""}])], ignore_index=True)
+    patterns[["Konto", "Gegenkonto"]] = \
+        patterns[["Konto", "Gegenkonto"]].astype(str)
+    return patterns
+
+def supplier_update(n_rows, seed=0):
+    """
+    Supplier file with `n_rows` rows, about 1 % failing the checks
+    (missing or duplicated `ean`, inconsistent `colorn`)
+    """
+    rnd = np.random.RandomState(seed)
+    block = np.arange(n_rows) // COLORS
+    colorn = np.arange(n_rows) % COLORS + 1
+    # 100 groups from 900, then from 9900 & 18900 (`consistency_check`
+    # compares `id` with group & color only for the latter)
+    groups = 900 + rnd.permutation(100)[block % 100] + 9000 * (block // 100)
+    ids = groups * 10000 + colorn
+    ean = pd.Series(4000000000000 + rnd.permutation(10 ** 7)[:n_rows] * 17,
+                    dtype="Int64")
+    update = pd.DataFrame({
+        "id":            ids,
+        "ean":           ean,
+        "product_group": groups,
+        "colorn":        colorn,
+        "name":          ["Garn %d" % (i // COLORS) for i in range(n_rows)],
+        "pricepunit":    rnd.randint(100, 2000, n_rows) / 100.,
+        "rrp":           rnd.randint(300, 6000, n_rows) / 100.,
+    })
+    bad = rnd.rand(n_rows)
+    update.loc[bad < 0.003, "ean"] = pd.NA
+    duplicated = np.flatnonzero((bad >= 0.003) & (bad < 0.006))
+    update.loc[duplicated, "ean"] = update["ean"].iloc[
+        (duplicated + 1) % n_rows].values
+    update.loc[(bad >= 0.006) & (bad < 0.01), "colorn"] += COLORS
+    return update
+
+def products_tables(update, n_rows, seed=0):
+    """
+    `products` with `n_rows` rows and `categories`: half of `update`
+    rows exist (10 % of them with other prices), a few share only
+    `REFERENCE` or `NAME`, the rest are unrelated products
+    """
+    rnd = np.random.RandomState(seed)
+    names = update["name"] + " " + \
+        (update["id"] % 10000).astype(str).str.zfill(4)
+    existing = update[rnd.rand(update.shape[0]) < 0.5]
+    products = pd.DataFrame({
+        "REFERENCE": existing["id"].astype(str),
+        "CODE":      existing["ean"].astype(str),
+        "NAME":      names[existing.index],
+        "PRICEBUY":  existing["pricepunit"],
+        "PRICESELL": (existing["rrp"] / 1.19).round(13),
+    })
+    changed = rnd.rand(products.shape[0]) < 0.1
+    products.loc[changed, "PRICEBUY"] += 1.
+    # Same `REFERENCE` other `CODE` (skipped) & same `NAME` only
+    other_code = rnd.rand(products.shape[0]) < 0.01
+    products.loc[other_code, "CODE"] = \
+        (9000000000000 + np.arange(other_code.sum())).astype(str)
+    other_keys = (rnd.rand(products.shape[0]) < 0.01) & ~other_code
+    products.loc[other_keys, "REFERENCE"] = \
+        (80000000 + np.arange(other_keys.sum())).astype(str)
+    products.loc[other_keys, "CODE"] = \
+        (8000000000000 + np.arange(other_keys.sum())).astype(str)
+
+    rest = max(n_rows - products.shape[0], 0)
+    products = pd.concat([products, pd.DataFrame({
+        "REFERENCE": (50000000 + np.arange(rest)).astype(str),
+        "CODE":      (7000000000000 + np.arange(rest)).astype(str),
+        "NAME":      ["Zubehör %07d" % i for i in range(rest)],
+        "PRICEBUY":  rnd.randint(100, 2000, rest) / 100.,
+        "PRICESELL": rnd.randint(200, 4000, rest) / 100.,
+    })], ignore_index=True)
+    products = products[products["CODE"] != "<NA>"]
+    for col in ("REFERENCE", "CODE", "NAME", ):
+        products = products.drop_duplicates(col)
+
+    # Categories of half the groups exist
+    groups = pd.unique(update["id"] // 10000).astype(str)
+    categories = pd.DataFrame({"NAME": groups[::2]})
+    categories["ID"] = [str(uuid.UUID(int=rnd.randint(0, 2 ** 62) + 1))
+                        for _ in range(categories.shape[0])]
+    products["ID"] = [str(uuid.UUID(int=i + 1))
+                      for i in range(products.shape[0])]
+    products["CATEGORY"] = categories["ID"].iloc[0]
+    products["TAXCAT"] = "001"
+    products["ISCOM"] = products["ISSCALE"] = b"\x00"
+    return products.reset_index(drop=True), categories[["ID", "NAME"]]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("folder")
+    parser.add_argument("--bank-rows", type=int, default=100000)
+    parser.add_argument("--update-rows", type=int, default=100000)
+    parser.add_argument("--products-rows", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    os.makedirs(args.folder, exist_ok=True)
+    with open(op.join(args.folder, "bank.csv"), "w",
+              encoding="cp1252") as f:
+        f.write(bank_export(args.bank_rows, args.seed))
+    update = supplier_update(args.update_rows, args.seed)
+    update.to_csv(op.join(args.folder, "update.csv"), sep=";", index=False,
+                  encoding="cp1252")
+    products, categories = products_tables(update, args.products_rows,
+                                           args.seed)
+    products.drop(["ISCOM", "ISSCALE"], axis=1).to_csv(
+        op.join(args.folder, "products.csv"), sep=";", index=False)
+    categories.to_csv(op.join(args.folder, "categories.csv"), sep=";",
+                      index=False)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+""" SQLite ledger of exported bookings
+
+Exports overlap, so the same booking is found in many files. The ledger
+keeps a 64-bit key of every booking written to an output: hash of
+`Buchungstag`, `Wert`, `Soll`, `Haben`, `Verwendungszweck` and of the
+occurrence of that booking in its file (identical bookings of one day
+stay apart). Keys are the integer primary key of `bookings`, so lookups
+stay logarithmic with millions of rows.
+"""
+import datetime
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+KEY_COLUMNS = ["Buchungstag", "Wert", "Soll", "Haben", "Verwendungszweck"]
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS exports (
+    id          INTEGER PRIMARY KEY
+    , file        TEXT NOT NULL
+    , exported_at TEXT NOT NULL
+    , rows        INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bookings (
+    hash   INTEGER PRIMARY KEY
+    , export INTEGER NOT NULL REFERENCES exports (id)
+);
+"""
+
+def open_ledger(path):
+    """ Connection to the ledger at `path`, created if missing """
+    cnx = sqlite3.connect(path, isolation_level=None, timeout=60)
+    cnx.execute("PRAGMA journal_mode = WAL")
+    cnx.executescript(SCHEMA)
+    cnx.execute("CREATE TEMP TABLE lookup (hash INTEGER PRIMARY KEY)")
+    return cnx
+
+def booking_keys(data, counts):
+    """
+    Keys of bookings in `data` (signed, as stored by SQLite).
+    `counts` - {booking hash: occurrences in earlier chunks of the file},
+               updated with `data`
+    """
+    bookings = pd.Series(pd.util.hash_pandas_object(data[KEY_COLUMNS],
+                                                    index=False).values)
+    occurrence = bookings.groupby(bookings).cumcount() + \
+        bookings.map(counts).fillna(0).astype(int)
+    for booking, count in bookings.value_counts().items():
+        counts[booking] = counts.get(booking, 0) + count
+    keys = pd.util.hash_pandas_object(pd.DataFrame({
+        "booking":    bookings,
+        "occurrence": occurrence,
+    }), index=False).values
+    return keys.view(np.int64)
+
+def known(cnx, keys):
+    """ True where a key of `keys` is in the ledger """
+    cnx.execute("BEGIN")
+    try:
+        cnx.execute("DELETE FROM lookup")
+        cnx.executemany("INSERT OR IGNORE INTO lookup VALUES (?)",
+                        ((key, ) for key in keys.tolist()))
+        found = [row[0] for row in cnx.execute(
+            "SELECT hash FROM lookup JOIN bookings USING (hash)")]
+    finally:
+        cnx.execute("ROLLBACK")
+    return np.isin(keys, np.array(found, dtype=np.int64))
+
+def record(cnx, keys, file):
+    """ Adds `keys` of bookings written into output `file` at once """
+    cnx.execute("BEGIN IMMEDIATE")
+    try:
+        export = cnx.execute(
+            "INSERT INTO exports (file, exported_at, rows) VALUES (?, ?, ?)",
+            (file, datetime.datetime.now().isoformat(timespec="seconds"),
+             len(keys))).lastrowid
+        # Sorted keys fill the B-tree page by page
+        cnx.executemany("INSERT OR IGNORE INTO bookings VALUES (?, ?)",
+                        ((key, export) for key in np.sort(keys).tolist()))
+    except BaseException:
+        cnx.execute("ROLLBACK")
+        raise
+    cnx.execute("COMMIT")
@@ -0,0 +1,91 @@
+""" Compiled pattern engine for `do_regex`
+
+Rules are compiled once. Every rule whose regex contains a plain literal
+run is put into a bucket keyed by the first characters of its longest
+literal (keyword). For a text only the rules of buckets present in the
+text (plus the rules without keyword) are tried, in the original order.
+First matching rule wins, as in the `PATTERNS.iterrows()` loop.
+"""
+import re
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+KEY_LENGTH = 3
+
+def literal_runs(parsed):
+    """ Yields runs of consecutive literals which every match contains """
+    run = []
+    for op, av in parsed:
+        if op == sre_parse.LITERAL:
+            run.append(chr(av))
+            continue
+        if run:
+            yield "".join(run)
+            run = []
+        if op == sre_parse.SUBPATTERN:
+            add_flags, subpattern = av[1], av[-1]
+            if not add_flags & re.IGNORECASE:
+                yield from literal_runs(subpattern)
+    if run:
+        yield "".join(run)
+
+def required_keyword(regex):
+    """ Longest literal required by `regex` or None if there is none """
+    compiled = re.compile(regex)
+    if compiled.flags & re.IGNORECASE:
+        return None
+    try:
+        runs = list(literal_runs(sre_parse.parse(regex)))
+    except (re.error, TypeError, ValueError):
+        return None
+    keyword = max(runs, key=len, default="")
+    return keyword if len(keyword) >= KEY_LENGTH else None
+
+def compile_patterns(records):
+    """
+    Build matching engine from pattern rows (list of dicts with `Regex`).
+    Returns dict with:
+     - `rules`:   rows with compiled `search`
+     - `always`:  rule numbers without keyword
+     - `buckets`: keyword prefix -> rule numbers
+    """
+    rules, always, buckets = [], [], {}
+    for number, record in enumerate(records):
+        rule = dict(record)
+        rule["search"] = re.compile(rule["Regex"]).search
+        rules.append(rule)
+
+        keyword = required_keyword(rule["Regex"])
+        if keyword is None:
+            always.append(number)
+        else:
+            buckets.setdefault(keyword[:KEY_LENGTH], []).append(number)
+    return {
+        "rules":   rules,
+        "always":  always,
+        "buckets": buckets,
+    }
+
+def candidates(engine, text):
+    """ Rule numbers which may match `text`, in original order """
+    grams = {text[i:i + KEY_LENGTH]
+             for i in range(len(text) - KEY_LENGTH + 1)}
+    hits = engine["buckets"].keys() & grams
+    if not hits:
+        return engine["always"]
+    numbers = list(engine["always"])
+    for key in hits:
+        numbers.extend(engine["buckets"][key])
+    numbers.sort()
+    return numbers
+
+def find_rule(engine, text):
+    """ First rule whose `Regex` matches `text` or None """
+    rules = engine["rules"]
+    for number in candidates(engine, text):
+        if rules[number]["search"](text):
+            return rules[number]
+    return None
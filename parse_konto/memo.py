@@ -0,0 +1,42 @@
+""" Persistent store of `do_regex` results between runs
+
+The store is a JSON file with the results of the most recently used
+texts. It is tied to a fingerprint of the pattern rows and is dropped
+as soon as the patterns change.
+"""
+import hashlib
+import json
+import os
+import os.path as op
+
+STORE_SIZE = 200000
+
+def patterns_fingerprint(records):
+    """ sha256 of pattern rows """
+    dump = json.dumps(records, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(dump.encode("utf8")).hexdigest()
+
+def load_store(path, fingerprint):
+    """ {text: result} saved for the same patterns, empty otherwise """
+    if not op.exists(path):
+        return dict()
+    with open(path, "r", encoding="utf8") as f:
+        store = json.load(f)
+    if store.get("fingerprint") != fingerprint:
+        return dict()
+    return dict(store["results"])
+
+def save_store(path, fingerprint, results, size=STORE_SIZE):
+    """
+    Saves `size` most recently used results of {text: result}, merged
+    with the store saved meanwhile by other processes (`--all`)
+    """
+    saved = load_store(path, fingerprint)
+    merged = [(text, result) for text, result in saved.items()
+              if text not in results]
+    recent = (merged + list(results.items()))[-size:]
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp_path, "w", encoding="utf8") as f:
+        json.dump({"fingerprint": fingerprint, "results": recent}, f,
+                  ensure_ascii=False)
+    os.replace(tmp_path, path)
@@ -0,0 +1,106 @@
+""" Stage timing, rows & peak memory of one run
+
+    with stage("read") as record:
+        data = read(...)
+        record["rows_out"] = data.shape[0]
+
+Repeated stages (chunks) are summed. `write_report` saves them as JSON.
+Memory is the peak of the whole process so far (`ru_maxrss`), not of
+the stage or file alone. The updater adds its counters on top of this
+module (`updater/updater/metrics.py`).
+"""
+import contextlib
+import json
+import os
+import time
+
+STAGES = dict()
+# Extra stage totals, {name: function returning a running count}
+COUNTERS = dict()
+START = None
+
+def start_run():
+    """ Forget stages of previous run """
+    global START
+
+    STAGES.clear()
+    START = time.perf_counter()
+
+def process_peak_rss_mb():
+    """ Peak resident memory of the process in MB, None if unknown """
+    try:
+        import resource
+    except ImportError: # Windows
+        return None
+    import sys
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KB elsewhere
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+@contextlib.contextmanager
+def stage(name, rows_in=None):
+    """ Records the block as stage `name`, set `rows_out` in the record """
+    record = {"rows_in": rows_in, "rows_out": None}
+    counts = {name: counter() for name, counter in COUNTERS.items()}
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        total = STAGES.setdefault(name, {
+            "calls": 0, "seconds": 0., "rows_in": None, "rows_out": None,
+            "process_peak_rss_mb": None,
+        })
+        total["calls"] += 1
+        total["seconds"] += time.perf_counter() - start
+        for key in ("rows_in", "rows_out"):
+            if record[key] is not None:
+                total[key] = (total[key] or 0) + int(record[key])
+        total["process_peak_rss_mb"] = process_peak_rss_mb()
+        for name, counter in COUNTERS.items():
+            total[name] = total.get(name, 0) + counter() - counts[name]
+
+def write_report(path, **info):
+    """ Saves `info` & recorded stages as JSON into `path` """
+    report = dict(info)
+    report["seconds"] = time.perf_counter() - START if START else None
+    report["process_peak_rss_mb"] = process_peak_rss_mb()
+    report["stages"] = STAGES
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp_path, "w") as f:
+        json.dump(report, f, indent=2)
+    os.replace(tmp_path, path)
+
+@contextlib.contextmanager
+def profiled(path, enabled=True):
+    """
+    Profiles the block with pyinstrument if installed (text report into
+    `path`.txt), with cProfile otherwise (stats into `path`.prof)
+    """
+    if not enabled:
+        yield
+        return
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        Profiler = None
+
+    if Profiler is not None:
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            with open(path + ".txt", "w") as f:
+                f.write(profiler.output_text())
+    else:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path + ".prof")
@@ -2,23 +2,78 @@ import datetime
 import os
 import os.path as op
 import re
+import sys
 import csv
-import pandas as pd
+import time
+from collections import OrderedDict
+
+from matcher import compile_patterns, find_rule
+from patterns import load_patterns
+from memo import patterns_fingerprint, load_store, save_store
+from metrics import stage, start_run, write_report, profiled
 
 ENCODING = "cp1252"
+REGEX_COLUMNS = ["BU", "Beleg1", "DATEV_Buchungstext", "Gegenkonto",
+                 "Konto", "Regex"]
 OUT_COLUMNS = ["Buchungstag", "SollHabenKNZ", "DATEV_Buchungstext",
                "BU", "Gegenkonto", "Konto", "Umsatz", "Verwendungszweck_fill",
                "Verwendungszweck", "Beleg1"]
 
 ROOT = op.abspath(op.join(__file__, op.pardir))
-try:
-    patterns_path = op.join(ROOT, "patterns.xlsx")
-    PATTERNS = pd.read_excel(patterns_path, encoding=ENCODING, sep=";")
-except FileNotFoundError as e:
-    print("Place `patterns.xlsx` into `parse konto` directory")
-    quit()
+PATTERNS_PATH = op.join(ROOT, "patterns.xlsx")
+ENGINE = None
+
+# `classify` memoization: in-memory LRU & optional persistent store
+MEMO_SIZE = 100000
+MEMO_PATH = op.join(ROOT, "regex_memo.json")
+MEMO = {"store": None, "memory hits": 0, "store hits": 0, "misses": 0,
+        "computed": dict(),
+        # {text: result} of the `MEMO_SIZE` most recently used texts,
+        # oldest first
+        "memory": OrderedDict()}
+
+# Parallel `do_regex` of new texts in a process pool of `workers`
+REGEX = {"workers": 1, "pool": None}
+# Fewer new texts of a chunk are classified serially
+PARALLEL_MIN_TEXTS = 2000
+
+# Bookings exported before are skipped (`ledger`), keys of new ones are
+# recorded once the output is written
+LEDGER_PATH = op.join(ROOT, "ledger.sqlite")
+LEDGER = {"cnx": None, "counts": dict(), "keys": [], "skipped": 0}
+
+def get_engine():
+    """ Pattern engine, built from cached `patterns.xlsx` on first use """
+    global ENGINE
+
+    if ENGINE is None:
+        try:
+            records = load_patterns(PATTERNS_PATH)
+        except FileNotFoundError as e:
+            print("Place `patterns.xlsx` into `parse konto` directory")
+            quit()
+        ENGINE = compile_patterns(records)
+        ENGINE["fingerprint"] = patterns_fingerprint(records)
+    return ENGINE
+
+def open_memo_store(path=MEMO_PATH):
+    """ Loads persistent `classify` results saved for current patterns """
+    MEMO["path"] = path
+    MEMO["store"] = load_store(path, get_engine()["fingerprint"])
+
+def save_memo_store():
+    """ Saves persistent `classify` results if the store is opened """
+    if MEMO["store"] is not None:
+        save_store(MEMO["path"], get_engine()["fingerprint"], MEMO["store"])
 
-PATTERNS.fillna("", inplace=True)
+def reset_memo_stats():
+    """ Counters of `classify` start again (pool processes run many files) """
+    MEMO.update({"memory hits": 0, "store hits": 0, "misses": 0})
+
+def print_memo_stats():
+    """ Prints hit & miss counters of `classify` since `reset_memo_stats` """
+    print("Regex cache: %d memory hits, %d store hits, %d misses" %
+          (MEMO["memory hits"], MEMO["store hits"], MEMO["misses"]))
 
 def select_file(folder, rows=8):
     files = [file for file in os.listdir(folder) if ".csv" in file]
@@ -45,28 +100,45 @@ def touch_folder(path):
     """ Creates folder if it does not exist """
     os.mkdir(path) if not op.exists(path) else None
 
-def join_columns(arr):
-    not_missing = [it for it in arr if it == it]
-    joined = " ".join(not_missing).replace("\"", "")
-    if len(joined) >= 160:
-        print("Shortened string: %s" % joined)
-    return joined[:160]
+def join_columns(columns):
+    """ Joins not missing values of each row, removes quotes, shortens """
+    import pandas as pd
+
+    joined = pd.Series("", index=columns.index)
+    filled = pd.Series(False, index=columns.index)
+    for i in range(columns.shape[1]):
+        column = columns.iloc[:, i]
+        present = column.notnull()
+        joined = joined.mask(filled & present, joined + " ") + \
+            column.fillna("")
+        filled |= present
+    joined = joined.str.replace("\"", "", regex=False)
+
+    for text in joined[joined.str.len() >= 160]:
+        print("Shortened string: %s" % text)
+    return joined.str[:160]
 
 def umsatz_handle(data):
-    knz_handle = lambda x: "H" if x < 0 else "S"
+    import numpy as np
 
     soll_haben = ["Soll", "Haben"]
     data[soll_haben] = data[soll_haben].astype(float)
     data["Umsatz"] = data[soll_haben].sum(axis=1)
-    data["SollHabenKNZ"] = data["Umsatz"].apply(knz_handle)
-    data["Umsatz"] = data["Umsatz"].abs().apply(lambda x: "%.2f" % x)
+    data["SollHabenKNZ"] = np.where(data["Umsatz"] < 0, "H", "S")
+    data["Umsatz"] = data["Umsatz"].abs().map("%.2f".__mod__)
     return data
 
-def format_decimals(x):
-    return x.replace(".", "").replace(",", ".") if x == x else 0
+def format_decimals(column):
+    """ German decimal strings to parsable ones, missing values to 0 """
+    if column.dtype != object:
+        return column.fillna(0)
+    return column.str.replace(".", "", regex=False)\
+        .str.replace(",", ".", regex=False).fillna(0)
+
+def format_kontoumsaetze(data):
+    """ Drops `Kontostand` rows, formats dates & numbers, renames columns """
+    import pandas as pd
 
-def read_kontoumsaetze(path):
-    data = pd.read_csv(path, sep=";", encoding=ENCODING, skiprows=4)
     data = data[data["Buchungstag"] != "Kontostand"]
 
     # Format dates
@@ -77,7 +149,7 @@ def read_kontoumsaetze(path):
 
     # Format numeric
     for col in "Soll", "Haben":
-        data[col] = data[col].apply(format_decimals)
+        data[col] = format_decimals(data[col])
 
     rename_columns = {
         "Begünstigter / Auftraggeber": "Auftraggeber",
@@ -86,92 +158,412 @@ def read_kontoumsaetze(path):
     data.rename(columns=rename_columns, inplace=True)
     return data
 
+def read_kontoumsaetze(path):
+    import pandas as pd
+
+    data = pd.read_csv(path, sep=";", encoding=ENCODING, skiprows=4)
+    return format_kontoumsaetze(data)
+
+def iter_kontoumsaetze(path, chunksize):
+    """ Yields formatted chunks of at most `chunksize` rows """
+    import pandas as pd
+
+    reader = pd.read_csv(path, sep=";", encoding=ENCODING, skiprows=4,
+                         chunksize=chunksize)
+    for chunk in reader:
+        yield format_kontoumsaetze(chunk)
+
 def do_regex(text):
-    global PATTERNS
-
-    for _, item in PATTERNS.iterrows():
-        if re.search(item["Regex"], text):
-            out_dict = {
-                "Konto":              item["Konto"],
-                "DATEV_Buchungstext": text,
-                "Regex":              item["Regex"]
-            }
-
-            if len(item["Gegenkonto"]) > 4:
-                split = item["Gegenkonto"].split("-")
-                out_dict["BU"], out_dict["Gegenkonto"] = split
-            else:
-                out_dict["BU"] = ""
-                out_dict["Gegenkonto"] = item["Gegenkonto"]
-
-            if "Electronic Cash Einreichung" in text:
-                try:
-                    referenz_nr = text.split("TERMINAL")[1]
-                    date = referenz_nr[10:16]
-                    date_beleg1 = datetime.datetime.strptime(date, "%y%m%d")
-                except IndexError as e:
-                    referenz_nr = "6809307420151029182210"
-                    date_beleg1 = datetime.date(2015, 10, 29)
-                    print("Date fake!!!")
-
-                out_dict["Beleg1"] = date_beleg1.strftime("%Y%m%d")
-                buchungstext = "EC Umsätze vom {} - Referenz-Nr. = {}".format(
-                    date_beleg1.strftime("%d.%m.%Y"),
-                    referenz_nr)
-                out_dict["DATEV_Buchungstext"] = buchungstext
-
-            if item["IF regex 1"]:
-                pattern = item["IF regex 1"]
-                repl = item["IF substitute 1"]
-                string = out_dict["DATEV_Buchungstext"]
-
-                out_dict["DATEV_Buchungstext"] = re.sub(pattern, repl, string)
-                if item["IF regex 2"]:
-                    pattern = item["IF regex 2"]
-                    repl = ""
-                    string = out_dict["DATEV_Buchungstext"]
-
-                    out_dict["DATEV_Buchungstext"] = re.sub(
-                        pattern, repl, string)
-
-            if len(out_dict["DATEV_Buchungstext"]) >= 60:
-                tmp_text = out_dict["DATEV_Buchungstext"]
-                out_dict["DATEV_Buchungstext"] = tmp_text[:60]
-            return pd.Series(out_dict)
-    return None
-
-def shorten_verwendungszweck(x):
-    if len(x) >= 210:
-        print("Following string was shortened to 210 symbols: %s" % x[:23])
-    return x[:210]
-
-def main():
-    # Read file from `input` directory
-    filename = select_file(op.join(ROOT, "input"))
-    path = op.join(ROOT, "input", filename)
-    data = read_kontoumsaetze(path)
+    """ Classification of `text` by the first matching pattern or None """
+    item = find_rule(get_engine(), text)
+    if item is None:
+        return None
+
+    out_dict = {
+        "Konto":              item["Konto"],
+        "DATEV_Buchungstext": text,
+        "Regex":              item["Regex"]
+    }
+
+    out_dict["BU"] = item["BU"]
+    out_dict["Gegenkonto"] = item["Gegenkonto"]
+
+    if "Electronic Cash Einreichung" in text:
+        try:
+            referenz_nr = text.split("TERMINAL")[1]
+            date = referenz_nr[10:16]
+            date_beleg1 = datetime.datetime.strptime(date, "%y%m%d")
+        except IndexError as e:
+            referenz_nr = "6809307420151029182210"
+            date_beleg1 = datetime.date(2015, 10, 29)
+            print("Date fake!!!")
+
+        out_dict["Beleg1"] = date_beleg1.strftime("%Y%m%d")
+        buchungstext = "EC Umsätze vom {} - Referenz-Nr. = {}".format(
+            date_beleg1.strftime("%d.%m.%Y"),
+            referenz_nr)
+        out_dict["DATEV_Buchungstext"] = buchungstext
+
+    if item["IF regex 1"]:
+        pattern = item["IF regex 1"]
+        repl = item["IF substitute 1"]
+        string = out_dict["DATEV_Buchungstext"]
+
+        out_dict["DATEV_Buchungstext"] = re.sub(pattern, repl, string)
+        if item["IF regex 2"]:
+            pattern = item["IF regex 2"]
+            repl = ""
+            string = out_dict["DATEV_Buchungstext"]
+
+            out_dict["DATEV_Buchungstext"] = re.sub(
+                pattern, repl, string)
+
+    if len(out_dict["DATEV_Buchungstext"]) >= 60:
+        tmp_text = out_dict["DATEV_Buchungstext"]
+        out_dict["DATEV_Buchungstext"] = tmp_text[:60]
+    return out_dict
+
+def classify(text):
+    """
+    `do_regex` memoized in memory (`MEMO["memory"]`) and in persistent
+    store if opened. Keyed on the raw text, the result holds it
+    (`DATEV_Buchungstext`)
+    """
+    memory = MEMO["memory"]
+    if text in memory:
+        MEMO["memory hits"] += 1
+        memory.move_to_end(text)
+        return memory[text]
+
+    store = MEMO["store"]
+    if store is not None and text in store:
+        MEMO["store hits"] += 1
+        store[text] = result = store.pop(text) # recently used at the end
+    else:
+        MEMO["misses"] += 1
+        # Computed in advance by `classify_all`
+        computed = MEMO["computed"]
+        result = computed.pop(text) if text in computed else do_regex(text)
+        if store is not None:
+            store[text] = result
+    memory[text] = result
+    if len(memory) > MEMO_SIZE:
+        memory.popitem(last=False)
+    return result
+
+def init_regex_worker(engine):
+    """ Pool process gets the compiled patterns once """
+    global ENGINE
+
+    ENGINE = engine
 
-    # Manipulations
-    data = umsatz_handle(data)
+def regex_pool():
+    """ Process pool of `REGEX["workers"]`, started on first use """
+    if REGEX["pool"] is None:
+        from concurrent.futures import ProcessPoolExecutor
+
+        REGEX["pool"] = ProcessPoolExecutor(max_workers=REGEX["workers"],
+                                            initializer=init_regex_worker,
+                                            initargs=(get_engine(), ))
+    return REGEX["pool"]
+
+def close_regex_pool():
+    if REGEX["pool"] is not None:
+        REGEX["pool"].shutdown()
+        REGEX["pool"] = None
+
+def classify_all(texts):
+    """
+    `classify` of distinct `texts` in their order. With several
+    `REGEX["workers"]`, texts missing in memory & the persistent store
+    are classified in the pool first if there are at least
+    `PARALLEL_MIN_TEXTS` of them.
+    """
+    store = MEMO["store"]
+    memory = MEMO["memory"]
+    new = [text for text in texts if text not in memory and
+           (store is None or text not in store)]
+    if REGEX["workers"] <= 1 or len(new) < PARALLEL_MIN_TEXTS:
+        return [classify(text) for text in texts]
+
+    # Few large tasks, the results come back in order
+    chunksize = -(-len(new) // (REGEX["workers"] * 4))
+    MEMO["computed"] = dict(zip(new, regex_pool().map(
+        do_regex, new, chunksize=chunksize)))
+    try:
+        # Fills memory cache & store as the serial run does
+        return [classify(text) for text in texts]
+    finally:
+        MEMO["computed"] = dict()
+
+def regex_columns(texts):
+    """ `classify` once per distinct text, spread over all rows """
+    import pandas as pd
+
+    unique = pd.unique(texts)
+    table = pd.DataFrame([result or {} for result in classify_all(unique)],
+                         index=unique).reindex(columns=REGEX_COLUMNS)
+    table = table.reindex(texts.values)
+    table.index = texts.index
+    return table
+
+def skip_exported(data):
+    """ Drops bookings found in the ledger, keeps keys of the others """
+    from ledger import booking_keys, known
+
+    keys = booking_keys(data, LEDGER["counts"])
+    exported = known(LEDGER["cnx"], keys)
+    LEDGER["keys"].append(keys[~exported])
+    LEDGER["skipped"] += int(exported.sum())
+    return data[~exported]
+
+def shorten_verwendungszweck(column):
+    for text in column[column.str.len() >= 210]:
+        print("Following string was shortened to 210 symbols: %s" % text[:23])
+    return column.str[:210]
+
+def transform(data):
+    """ Adds output columns to data read by `read_kontoumsaetze` """
+    rows = data.shape[0]
+    with stage("umsatz", rows) as record:
+        data = umsatz_handle(data)
+        record["rows_out"] = rows
     that_word = "Verwendungszweck"
-    data[that_word] = data.iloc[:, 2:8].apply(join_columns, axis=1)
+    with stage("join", rows) as record:
+        data[that_word] = join_columns(data.iloc[:, 2:8])
+        record["rows_out"] = rows
+
+    if LEDGER["cnx"] is not None:
+        with stage("ledger", rows) as record:
+            data = skip_exported(data)
+            record["rows_out"] = rows = data.shape[0]
 
-    out_cols = ["BU", "Beleg1", "DATEV_Buchungstext", "Gegenkonto",
-                "Konto", "Regex"]
-    data[out_cols] = data[that_word].apply(do_regex)[out_cols]
+    with stage("regex", rows) as record:
+        data[REGEX_COLUMNS] = regex_columns(data[that_word])
+        record["rows_out"] = data["Konto"].notnull().sum()
 
     data[that_word + "_fill"] = that_word
-    data[that_word] = data[that_word].apply(shorten_verwendungszweck)
+    data[that_word] = shorten_verwendungszweck(data[that_word])
+    return data
 
-    # Save output into `output` directory
-    touch_folder(op.join(ROOT, "output"))
-    out_path = op.join(ROOT, "output", filename)
-    data[OUT_COLUMNS].to_csv(out_path, sep=";", index=False,
+def write_output(data, out_path, mode="w"):
+    """ Writes (or appends) `OUT_COLUMNS` of data in the output format """
+    data[OUT_COLUMNS].to_csv(out_path, sep=";", index=False, mode=mode,
                              header=False, encoding=ENCODING,
                              quoting=csv.QUOTE_ALL,
                              line_terminator=";\n")
-    return data
+
+def process_file(path, chunksize=None, regex_workers=1, ledger=None):
+    """
+    Transforms input file at `path` into `output` directory.
+    With `chunksize` the file is streamed: each chunk is transformed and
+    appended to the output, so memory does not grow with the file.
+    `regex_workers` processes classify new texts (see `classify_all`).
+    `ledger` - path of the ledger: bookings exported before are left out
+               and the new ones are recorded after the output is written
+    Returns output shape.
+    """
+    # More processes than cores only add overhead
+    REGEX["workers"] = min(regex_workers, os.cpu_count() or 1)
+    if ledger:
+        from ledger import open_ledger
+
+        LEDGER.update(cnx=open_ledger(ledger), counts=dict(), keys=[],
+                      skipped=0)
+    try:
+        shape = transform_file(path, chunksize)
+        if ledger:
+            record_exported(op.basename(path))
+        return shape
+    finally:
+        close_regex_pool()
+        if LEDGER["cnx"] is not None:
+            LEDGER["cnx"].close()
+            LEDGER.update(cnx=None, counts=dict(), keys=[])
+
+def record_exported(file):
+    """ Records keys of bookings written into output `file` """
+    import numpy as np
+    from ledger import record
+
+    keys = np.concatenate(LEDGER["keys"] or [np.array([], dtype=np.int64)])
+    record(LEDGER["cnx"], keys, file)
+    print("Ledger: %d bookings exported before, %d new" %
+          (LEDGER["skipped"], keys.shape[0]))
+
+def transform_file(path, chunksize=None):
+    """
+    `process_file` body. The output is written under a temporary name
+    and replaces `output/<file>` at the end. With the ledger an existing
+    output is kept if every booking was exported before (same file again).
+    """
+    touch_folder(op.join(ROOT, "output"))
+    out_path = op.join(ROOT, "output", op.basename(path))
+    tmp_path = "%s.%d.tmp" % (out_path, os.getpid())
+    try:
+        shape = write_transformed(path, tmp_path, chunksize)
+    except BaseException:
+        if op.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    if not shape[0] and LEDGER["cnx"] is not None and op.exists(out_path):
+        os.remove(tmp_path)
+        print("No new bookings, `output/%s` is kept" % op.basename(path))
+    else:
+        os.replace(tmp_path, out_path)
+    return shape
+
+def write_transformed(path, out_path, chunksize=None):
+    """ Transforms input file at `path` into `out_path` """
+    if not chunksize:
+        with stage("read") as record:
+            data = read_kontoumsaetze(path)
+            record["rows_out"] = data.shape[0]
+        data = transform(data)
+        with stage("write", data.shape[0]) as record:
+            write_output(data, out_path)
+            record["rows_out"] = data.shape[0]
+        return data[OUT_COLUMNS].shape
+
+    rows, mode = 0, "w"
+    chunks = iter_kontoumsaetze(path, chunksize)
+    while True:
+        with stage("read") as record:
+            chunk = next(chunks, None)
+            record["rows_out"] = 0 if chunk is None else chunk.shape[0]
+        if chunk is None:
+            break
+        chunk = transform(chunk)
+        with stage("write", chunk.shape[0]) as record:
+            write_output(chunk, out_path, mode)
+            record["rows_out"] = chunk.shape[0]
+        rows, mode = rows + chunk.shape[0], "a"
+    if mode == "w":
+        open(out_path, "w").close()
+    return rows, len(OUT_COLUMNS)
+
+def reported_process_file(path, chunksize=None, profile=False,
+                          regex_workers=1, ledger=None):
+    """
+    `process_file` saving stage metrics into `logging/<file>_report.json`
+    and with `profile` a profile into `logging/<file>_profile.*`
+    """
+    touch_folder(op.join(ROOT, "logging"))
+    name = op.splitext(op.basename(path))[0]
+    start_run()
+    reset_memo_stats()
+    shape = None
+    try:
+        with profiled(op.join(ROOT, "logging", name + "_profile"), profile):
+            shape = process_file(path, chunksize, regex_workers, ledger)
+    finally:
+        write_report(op.join(ROOT, "logging", name + "_report.json"),
+                     file=path, rows=shape and shape[0],
+                     failed=shape is None, chunksize=chunksize,
+                     regex_workers=regex_workers, ledger=ledger)
+    return shape
+
+def timed_process_file(path, chunksize=None, profile=False,
+                       regex_workers=1, ledger=None):
+    """ `process_file` returning (rows, seconds) """
+    start = time.time()
+    rows, _ = reported_process_file(path, chunksize, profile, regex_workers,
+                                    ledger)
+    seconds = time.time() - start
+
+    save_memo_store()
+    print("%s: " % op.basename(path), end="")
+    print_memo_stats()
+    return rows, seconds
+
+def run_batch(folder, workers=None, chunksize=None, memo=False,
+              profile=False, regex_workers=1, ledger=None):
+    """
+    Processes every `.csv` file of `folder` in a process pool.
+    A failing file does not stop the others. With `ledger` files run
+    one after another in name order, so overlapping exports emit each
+    booking once.
+    Returns {filename: (rows, seconds, error)}
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    files = sorted(file for file in os.listdir(folder) if ".csv" in file)
+    results = dict()
+    initializer = open_memo_store if memo else None
+    if ledger:
+        workers = 1
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=initializer) as pool:
+        futures = {
+            file: pool.submit(timed_process_file,
+                              op.join(folder, file), chunksize, profile,
+                              regex_workers, ledger)
+            for file in files
+        }
+        for file, future in futures.items():
+            try:
+                rows, seconds = future.result()
+                results[file] = (rows, seconds, None)
+            except (Exception, SystemExit) as e:
+                results[file] = (0, 0., "%s: %s" % (type(e).__name__, e))
+    return results
+
+def print_summary(results):
+    """ Prints rows, timing & failures per file """
+    print("\n%-40s%10s%10s  %s" % ("File", "Rows", "Seconds", "Error"))
+    for file, (rows, seconds, error) in results.items():
+        print("%-40s%10d%10.2f  %s" % (file, rows, seconds, error or ""))
+    failed = sum(error is not None for _, _, error in results.values())
+    print("\nProcessed: %d, failed: %d" % (len(results) - failed, failed))
+
+def main(chunksize=None, profile=False, regex_workers=1, ledger=None):
+    """ Transforms input file selected from menu. Returns output shape """
+    filename = select_file(op.join(ROOT, "input"))
+    return reported_process_file(op.join(ROOT, "input", filename),
+                                 chunksize, profile, regex_workers, ledger)
 
 if __name__ == "__main__":
-    data = main()
-    print("\nOutput shape: %d x %d" % data.shape)
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Transform bank export into DATEV format")
+    parser.add_argument("--chunksize", type=int, default=None,
+                        help="stream input in chunks of that many rows")
+    parser.add_argument("--all", metavar="DIR", nargs="?",
+                        const=op.join(ROOT, "input"),
+                        help="process every `.csv` of DIR without menu "
+                             "(default: `input`)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="processes for `--all` (default: CPU count)")
+    parser.add_argument("--memo", action="store_true",
+                        help="keep regex results between runs "
+                             "in `regex_memo.json`")
+    parser.add_argument("--profile", action="store_true",
+                        help="profile each file (pyinstrument if "
+                             "installed, cProfile otherwise) into `logging`")
+    parser.add_argument("--regex-workers", type=int, default=1,
+                        help="processes classifying the texts of a file, "
+                             "small inputs stay serial (default: 1)")
+    parser.add_argument("--ledger", metavar="PATH", nargs="?",
+                        const=LEDGER_PATH,
+                        help="leave out bookings exported before and "
+                             "record the new ones in a SQLite ledger "
+                             "(default: `ledger.sqlite`)")
+    args = parser.parse_args()
+
+    if args.all:
+        results = run_batch(args.all, args.workers, args.chunksize,
+                            args.memo, args.profile, args.regex_workers,
+                            args.ledger)
+        print_summary(results)
+        if any(error for _, _, error in results.values()):
+            sys.exit(1)
+    else:
+        if args.memo:
+            open_memo_store()
+        shape = main(args.chunksize, args.profile, args.regex_workers,
+                     args.ledger)
+        save_memo_store()
+        print("\nOutput shape: %d x %d" % shape)
+        print_memo_stats()
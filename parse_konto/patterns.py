@@ -0,0 +1,82 @@
+""" Preparsed cache of `patterns.xlsx`
+
+Parsing the spreadsheet with openpyxl costs more than transforming a
+small daily file, so the rows are stored as JSON next to it. The cache
+is keyed by mtime and sha256 of the spreadsheet and rebuilt only when
+the spreadsheet changes.
+"""
+import hashlib
+import json
+import os
+import os.path as op
+
+CACHE_VERSION = 1
+COLUMNS = ["Regex", "Konto", "BU", "Gegenkonto", "IF regex 1",
+           "IF substitute 1", "IF regex 2"]
+
+def file_hash(path):
+    """ sha256 hex digest of file content """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def plain(value):
+    """ numpy scalar to python value (JSON serializable) """
+    return value.item() if hasattr(value, "item") else value
+
+def split_gegenkonto(gegenkonto):
+    """ `BU-Gegenkonto` into (BU, Gegenkonto), short values have no BU """
+    if len(gegenkonto) > 4:
+        bu, gegenkonto = gegenkonto.split("-")
+        return bu, gegenkonto
+    return "", gegenkonto
+
+def read_patterns(xlsx_path, encoding="cp1252"):
+    """ Reads `patterns.xlsx` into list of dicts with `COLUMNS` """
+    import pandas as pd
+
+    patterns = pd.read_excel(xlsx_path, encoding=encoding, sep=";")
+    patterns.fillna("", inplace=True)
+
+    records = list()
+    for record in patterns.to_dict("records"):
+        record = {key: plain(value) for key, value in record.items()}
+        record["BU"], record["Gegenkonto"] = \
+            split_gegenkonto(record["Gegenkonto"])
+        records.append({col: record.get(col, "") for col in COLUMNS})
+    return records
+
+def load_patterns(xlsx_path, cache_path=None):
+    """
+    Pattern rows from cache if it matches `xlsx_path`,
+    otherwise reads the spreadsheet and rewrites the cache.
+    """
+    cache_path = cache_path or op.splitext(xlsx_path)[0] + ".cache.json"
+    mtime = os.stat(xlsx_path).st_mtime
+
+    cache = None
+    if op.exists(cache_path):
+        with open(cache_path, "r", encoding="utf8") as f:
+            cache = json.load(f)
+        if cache.get("version") != CACHE_VERSION:
+            cache = None
+
+    if cache is not None and cache["mtime"] == mtime:
+        return cache["patterns"]
+
+    digest = file_hash(xlsx_path)
+    if cache is None or cache["sha256"] != digest:
+        cache = {
+            "version":  CACHE_VERSION,
+            "sha256":   digest,
+            "patterns": read_patterns(xlsx_path),
+        }
+    cache["mtime"] = mtime
+
+    tmp_path = "%s.%d.tmp" % (cache_path, os.getpid())
+    with open(tmp_path, "w", encoding="utf8") as f:
+        json.dump(cache, f, ensure_ascii=False)
+    os.replace(tmp_path, cache_path)
+    return cache["patterns"]
@@ -1,80 +1,61 @@
 import os
 import os.path as op
+import sys
+import itertools
 import logging
 
-import pandas as pd
+TAX_GROUPS = (923, 941, 946, 957, 959, 975, 985, 986, )
 
 def TAXCAT(product_group):
-    """ Calculate `TAXCAT` from `product_group` """
-    tax_groups = (923, 941, 946, 957, 959, 975, 985, 986, )
-    return "%03d" % int(product_group not in tax_groups)
+    """ Calculate `TAXCAT` column from `product_group` column """
+    import numpy as np
+    import pandas as pd
+
+    return pd.Series(np.where(product_group.isin(TAX_GROUPS), "000", "001"),
+                     index=product_group.index)
 
 def PRICESELL(data):
     """ Calculate `PRICESELL` from `rrp` & `TAXCAT` """
-    tmp = data["TAXCAT"].apply(lambda x: 1.19 if x == "000" else 1.07)
-    return data["rrp"] / tmp
-
-def generate_hash(x): # TODO `ID`
-    """ Generate `ID` value """
-    from uuid import uuid4
-
-    return str(uuid4())
-
-def set_category(data):
-    """ Finds ID in categories or creates new and updates categories """
-    from updater.db_connect import fetch_table
-
-    data["tmp"] = (data["REFERENCE"] // 10000).astype(str)
-
-    # Fetch existing categories
-    categories = fetch_table("categories", columns=["ID", "NAME"])\
-        .rename(columns={"NAME": "tmp", "ID": "CATEGORY"})
-
-    # Join `categories` to find existing categories
-    data = data.merge(categories, on="tmp", how="left")
-
-    # Create new `categories` table and check if it has new categories
-    categories = data[["CATEGORY", "tmp"]].drop_duplicates()
-    new_categories_ix = categories["CATEGORY"].isnull()
-    if new_categories_ix.sum():
-        from updater.db_connect import insert_categories
-
-        categories.loc[new_categories_ix, "CATEGORY"] = \
-            categories.loc[new_categories_ix].apply(generate_hash, axis=1)
-
-        # Find new categories
-        new_categories = categories.loc[new_categories_ix]
+    import numpy as np
+
+    return data["rrp"] / np.where(data["TAXCAT"] == "000", 1.19, 1.07)
+
+def set_category(data, create=True):
+    """
+    Sets `CATEGORY` from cached category IDs, missing categories get new
+    IDs, inserted with the products if `create`, otherwise kept for the
+    run only (dry run).
+    Returns data & `ID` & `NAME` of new categories or None
+    """
+    from updater.categories import resolve
+
+    names = (data["REFERENCE"] // 10000).astype(str)
+    data["CATEGORY"], new_categories = resolve(names, create)
+    if new_categories is not None and new_categories.shape[0]:
         logging.info("%-30s%d" %
             ("new categories:", new_categories.shape[0]))
+        return data, new_categories
+    return data, None
 
-        # Update ID in data
-        data = data.drop("CATEGORY", axis=1).merge(categories, on="tmp")
-        return data, new_categories.rename(columns={
-                "CATEGORY": "ID",
-                "tmp": "NAME",
-            })
-    return data.drop("tmp", axis=1), None
-
-def fill_0b(x): # TODO `ISCOM`, `ISSCALE`
-    """ Fill `ISCOM` & `ISSCALE` """
-    return b"\x00"
-
-def calculate_fields(data):
+def calculate_fields(data, create=True):
     """ Calculate necessary fields:
     1) `TAXCAT`    from `product_group`
     2) `PRICESELL` from `rrp` & `TAXCAT`
     3) Fill `CATEGORY` with `000`, `ID` with generated hashes,
        `ISCOM` & `ISSCALE` with `1b`
+    `create` is passed to `set_category`
        """
-    data["TAXCAT"]    = data["product_group"].apply(TAXCAT)
-    data["temp"]      = data["TAXCAT"]\
-        .apply(lambda x: 1.19 if x == "001" else 1.07)
+    import numpy as np
+    from updater.schema import generate_ids
+
+    data["TAXCAT"]    = TAXCAT(data["product_group"])
+    data["temp"]      = np.where(data["TAXCAT"] == "001", 1.19, 1.07)
     data["PRICESELL"] = (data["rrp"] / data["temp"]).round(13)
-    data["ID"]        = data.apply(generate_hash, axis=1)
+    data["ID"]        = generate_ids(data.shape[0])
 
-    data, new_categories = set_category(data)
+    data, new_categories = set_category(data, create)
     for col in ["ISCOM", "ISSCALE"]:
-        data[col] = data.apply(fill_0b, axis=1)
+        data[col] = b"\x00"
     return data, new_categories
 
 def select_file(folder, rows=8):
@@ -99,16 +80,11 @@ def select_file(folder, rows=8):
             except IndexError as e:
                 continue
 
-def main():
-    from updater.inserter \
-        import prepare_to_insert, decide_before_insert, touch_folder
-    from updater.consistency_checker import read_update, clean_input
-    from updater.db_connect \
-        import fetch_table, insert_products, insert_categories
-
-    root = os.getcwd()
+def setup_logging(root):
+    """ Log into `logging/text_log.log` and terminal """
+    from updater.inserter import touch_folder
 
-    touch_folder(op.join(os.getcwd(), "logging"))
+    touch_folder(op.join(root, "logging"))
     logging.basicConfig(level=logging.INFO,
         format="%(levelname)s - %(asctime)s - %(msg)s",
         datefmt="%Y-%m-%d %H:%M:%S",
@@ -117,15 +93,23 @@ def main():
             logging.StreamHandler(),
         ])
 
-    filename = select_file(op.join(root, "input"))
-    update_path = op.join(root, "input", filename)
+RENAME_COLUMNS = {
+    "id":         "REFERENCE",
+    "ean":        "CODE",
+    "p_NAME":     "NAME",
+    "pricepunit": "PRICEBUY",
+}
+
+def log_paths(update_path):
+    """ Dictionary of all used file_paths, creates logging folder """
+    from updater.inserter import touch_folder
 
-    # Dictionary of all used file_paths
+    filename = op.basename(update_path)
     logging_folder = "%s_log" % op.splitext(filename)[0]
     logging_folder = op.join("logging", logging_folder)
     logging.info("%-30s%s" % ("Logging folder:", logging_folder))
     touch_folder(op.join(os.getcwd(), logging_folder))
-    paths = {
+    return {
         # Input
         "update": update_path,
 
@@ -135,48 +119,545 @@ def main():
         "insert_rows":    op.join(logging_folder, "inserted_rows.csv"),
         "update_rows":    op.join(logging_folder, "updated_rows.csv"),
         "new_categories": op.join(logging_folder, "new_categories.csv"),
+        "diff":           op.join(logging_folder, "dry_run_diff.csv"),
+
+        # Rows applied by all runs
+        "fingerprints":   op.join("logging", "fingerprints.npz"),
+
+        # Run metrics
+        "report":         op.join(logging_folder, "run_report.json"),
+        "profile":        op.join(logging_folder, "profile"),
     }
 
+def run(update_path, server_decision=False, snapshot=False,
+        resync=False, chunksize=None, dry_run=False, profile=False,
+        overlap=False, full=False):
+    """
+    Check, decide & insert one update file. Returns modified rows.
+    `server_decision` - read only products matching the file's keys
+    `snapshot`        - read products from local snapshot refreshed with
+                        changed rows only, `resync` refetches it fully
+    `chunksize`       - out-of-core mode, see `run_streaming`
+    `dry_run`         - read-only connection, writes `dry_run_diff.csv`
+                        instead of inserting
+    `profile`         - profile of the run into the logging folder
+    `overlap`         - database reads & log writes in threads next to
+                        the CSV work (without `chunksize`)
+    `full`            - process every row, otherwise rows unchanged
+                        since earlier runs are skipped (`fingerprints`)
+    Stage metrics are saved in `run_report.json` of the logging folder.
+    """
+    from updater.db_connect import set_read_only
+    from updater.metrics import start_run, write_report, profiled
+    from updater import categories
+
+    set_read_only(dry_run)
+    paths = log_paths(update_path)
+    start_run()
+    categories.start_run()
+    rows = None
+    try:
+        with profiled(paths["profile"], profile):
+            if chunksize:
+                rows = run_streaming(paths, chunksize, dry_run, full)
+            else:
+                rows = run_in_memory(paths, server_decision, snapshot,
+                                     resync, dry_run, overlap, full)
+    finally:
+        write_report(paths["report"], file=update_path, rows=rows,
+                     failed=rows is None, server_decision=server_decision,
+                     snapshot=snapshot, chunksize=chunksize,
+                     dry_run=dry_run, overlap=overlap, full=full)
+    return rows
+
+def read_update_fields(paths, dry_run=False, categories_loaded=None,
+                       full=True):
+    """
+    Reads & checks the update file, adds calculated fields.
+    `categories_loaded` - future of the category cache loading, awaited
+                          before the fields
+    `full`              - otherwise rows unchanged since earlier runs
+                          are dropped before the checks
+    Returns update, new categories (None if there are none) &
+    fingerprints to store once the rows are applied
+    """
+    import numpy as np
+    from updater.consistency_checker import read_update, clean_input
+    from updater.fingerprints import fingerprints, load_store, \
+        skip_unchanged
+    from updater.schema import log_memory
+    from updater.metrics import stage, add_count
+
     # Read `update.csv`
-    update = read_update(paths["update"])
+    with stage("read") as record:
+        update = read_update(paths["update"])
+        record["rows_out"] = update.shape[0]
+
+    unchanged = (np.array([], dtype=np.uint64), ) * 2
+    if not full:
+        with stage("fingerprints", update.shape[0]) as record:
+            update, unchanged = skip_unchanged(
+                update, load_store(paths["fingerprints"]))
+            add_count("short_circuited", unchanged[0].shape[0])
+            record["rows_out"] = update.shape[0]
 
     # Check consistency
-    update = clean_input(update, paths["consistency"])
+    with stage("clean", update.shape[0]) as record:
+        update = clean_input(update, paths["consistency"])
+        record["rows_out"] = update.shape[0]
+    seen = tuple(np.concatenate(pair) for pair in
+                 zip(unchanged, fingerprints(update)))
 
     # Rename ready columns
-    rename_columns = {
-        "id":         "REFERENCE",
-        "ean":        "CODE",
-        "p_NAME":     "NAME",
-        "pricepunit": "PRICEBUY",
-    }
-    update.rename(columns=rename_columns, inplace=True)
+    update.rename(columns=RENAME_COLUMNS, inplace=True)
     logging.info("%-30s%d" % ("Rows after cleaning:", update.shape[0]))
-
-    # Fetch `products` from database
-    columns = list(rename_columns.values()) + ["PRICESELL", ]
-    products = fetch_table("products", columns)
-    products["REFERENCE"] = products["REFERENCE"].astype(int)
-    products["CODE"]      = products["CODE"].astype(float)
-    products["PRICESELL"] = products["PRICESELL"].round(13)
+    log_memory("clean", update)
 
     # Add neccessary columns
-    update, new_categories = calculate_fields(update)
-
-    # Decide action for each update item
-    update = decide_before_insert(update, products, paths)
+    if categories_loaded is not None:
+        categories_loaded.result()
+    with stage("calculate_fields", update.shape[0]) as record:
+        update, new_categories = calculate_fields(update, not dry_run)
+        record["rows_out"] = update.shape[0]
+    log_memory("fields", update)
+    return update, new_categories, seen
+
+def fetch_products(snapshot=False, resync=False):
+    """ Typed `products` columns used by the decision """
+    from updater.db_connect import fetch_table
+    from updater.schema import products_frame
+
+    columns = list(RENAME_COLUMNS.values()) + ["PRICESELL", ]
+    if snapshot:
+        from updater.snapshot import load_products
+
+        products = load_products(
+            op.join("logging", "products_snapshot.feather"),
+            columns, full=resync)
+    else:
+        products = fetch_table("products", columns)
+    return products_frame(products)
+
+def run_in_memory(paths, server_decision=False, snapshot=False,
+                  resync=False, dry_run=False, overlap=False, full=True):
+    """
+    `run` with the whole file in memory.
+    `overlap` fetches `products` & categories in threads while the file
+    is read & checked, and writes decision logs during the insert.
+    `full` is passed to `read_update_fields`.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from updater.inserter import prepare_to_insert, decide_indexed, \
+        decision_diff, log_data, log_decided
+    from updater.db_connect import insert_products, transaction
+    from updater.categories import create, remember, committed_ids
+    from updater.fingerprints import save_store
+    from updater.schema import log_memory
+    from updater.metrics import stage
+
+    pool = ThreadPoolExecutor(max_workers=2) if overlap else None
+    try:
+        fetched = dict()
+        if overlap:
+            from updater.categories import load
+
+            # Database reads wait on the network, not on the CSV parser
+            fetched["categories"] = pool.submit(load)
+            if not server_decision:
+                fetched["products"] = pool.submit(fetch_products, snapshot,
+                                                  resync)
+        update, new_categories, seen = read_update_fields(
+            paths, dry_run, fetched.get("categories"), full)
+        if not update.shape[0]:
+            logging.info("No changed rows")
+            logging.info("-------------------------------------------------")
+            return 0
+
+        # Decide action for each update item, logs are written later
+        # if `overlap`
+        decision_logs = None if overlap else paths
+        if server_decision:
+            from updater.staging import decide_on_server
+
+            with stage("decide", update.shape[0]) as record:
+                update = decide_on_server(update, decision_logs)
+                record["rows_out"] = update.shape[0]
+        else:
+            # Fetch `products` from database
+            with stage("fetch") as record:
+                products = fetched["products"].result() if overlap \
+                    else fetch_products(snapshot, resync)
+                record["rows_out"] = products.shape[0]
+            log_memory("products", products)
+
+            with stage("decide", update.shape[0]) as record:
+                update = decide_indexed(update, products, decision_logs)
+                record["rows_out"] = update.shape[0]
+        log_memory("decide", update)
+        diff = decision_diff(update, new_categories) if dry_run else None
+        if overlap:
+            logs = [pool.submit(log_decided, update, paths)]
+            if dry_run:
+                logs.append(pool.submit(log_data, diff, paths["diff"]))
+        elif dry_run:
+            log_data(diff, paths["diff"])
+
+        with stage("prepare", update.shape[0]) as record:
+            # Leave only insert & update data
+            update = update[update["decision"] != "skip"]\
+                .drop("decision", axis=1)
+            # Format columns & insert data
+            update = prepare_to_insert(update)
+            record["rows_out"] = update.shape[0]
+        if dry_run:
+            logging.info("Dry run, nothing inserted")
+        else:
+            with stage("insert", update.shape[0]) as record, \
+                    transaction() as cnx:
+                # New categories & products are committed together
+                if new_categories is not None:
+                    created, ids = create(new_categories, cnx)
+                    update["CATEGORY"] = committed_ids(
+                        update["CATEGORY"], new_categories, ids)
+                insert_products(update, cnx)
+                record["rows_out"] = update.shape[0]
+            if new_categories is not None:
+                remember(ids)
+                log_data(created, paths["new_categories"])
+            save_store(paths["fingerprints"], *seen)
+        if overlap:
+            with stage("logs"):
+                for future in logs:
+                    future.result()
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    logging.info("-------------------------------------------------")
+    return update.shape[0]
+
+def run_streaming(paths, chunksize, dry_run=False, full=True):
+    """
+    Out-of-core `run` for files larger than memory, with the same
+    inserted rows & logs. Holds one chunk of `chunksize` rows plus
+    the duplicate keys of the file:
+    1) first pass collects values duplicated in the whole file
+    2) second pass cleans & decides each chunk on the products matching
+       its keys (as with `server_decision`, same decisions as in memory)
+       and spills the rows to insert to disk
+    3) new categories & spilled chunks are inserted in one transaction
+    No product is inserted before all chunks are decided, so every chunk
+    is compared with `products` as it was before the run.
+    `dry_run` writes the diff of each chunk instead of inserting.
+    Unless `full`, rows unchanged since earlier runs are dropped from
+    each chunk before the checks.
+    """
+    import tempfile
+    import numpy as np
+    import pandas as pd
+    from updater.inserter import prepare_to_insert, log_data, \
+        decision_diff, category_diff
+    from updater.consistency_checker import read_update, clean_input
+    from updater.db_connect import insert_products, transaction
+    from updater.categories import create, remember, committed_ids
+    from updater.staging import decide_on_server, odd_keys
+    from updater.streaming import duplicate_keys, spill, iter_spilled
+    from updater.fingerprints import fingerprints, load_store, \
+        save_store, skip_unchanged
+    from updater.schema import log_memory
+    from updater.metrics import stage, add_count
+
+    # Logs are appended chunk by chunk
+    for name in ("consistency", "skip_rows", "insert_rows", "update_rows",
+                 "new_categories", "diff"):
+        if op.exists(paths[name]):
+            os.remove(paths[name])
+
+    with stage("keys"):
+        dup_keys = duplicate_keys(paths["update"], chunksize)
+    store = None if full else load_store(paths["fingerprints"])
+    # `products` do not change until the insert
+    odd = odd_keys()
+    # (`id` hashes, row hashes) of each chunk to store after the insert
+    seen = []
+    new_categories = []
+    with tempfile.TemporaryDirectory() as spill_folder:
+        chunks = read_update(paths["update"], chunksize)
+        for number in itertools.count():
+            with stage("read") as record:
+                update = next(chunks, None)
+                record["rows_out"] = 0 if update is None else update.shape[0]
+            if update is None:
+                break
+            logging.info("%-30s%d" % ("Chunk %d rows:" % number,
+                                      update.shape[0]))
+            if store is not None:
+                with stage("fingerprints", update.shape[0]) as record:
+                    update, unchanged = skip_unchanged(update, store,
+                                                       dup_keys)
+                    add_count("short_circuited", unchanged[0].shape[0])
+                    record["rows_out"] = update.shape[0]
+                seen.append(unchanged)
+            with stage("clean", update.shape[0]) as record:
+                update = clean_input(update, paths["consistency"],
+                                     dup_keys=dup_keys, append=True)
+                record["rows_out"] = update.shape[0]
+            seen.append(fingerprints(update))
+            if not update.shape[0]:
+                continue
+            update.rename(columns=RENAME_COLUMNS, inplace=True)
+
+            with stage("calculate_fields", update.shape[0]) as record:
+                update, chunk_categories = calculate_fields(update,
+                                                            not dry_run)
+                record["rows_out"] = update.shape[0]
+            if chunk_categories is not None:
+                new_categories.append(chunk_categories)
+
+            with stage("decide", update.shape[0]) as record:
+                update = decide_on_server(update, paths, append=True,
+                                          odd=odd)
+                record["rows_out"] = update.shape[0]
+            log_memory("chunk %d" % number, update)
+            if dry_run:
+                log_data(decision_diff(update), paths["diff"], append=True)
+            with stage("prepare", update.shape[0]) as record:
+                update = update[update["decision"] != "skip"]\
+                    .drop("decision", axis=1)
+                update = prepare_to_insert(update)
+                spill(update, spill_folder, number)
+                record["rows_out"] = update.shape[0]
+
+        if dry_run:
+            if new_categories:
+                log_data(category_diff(pd.concat(new_categories)),
+                         paths["diff"], append=True)
+            rows = sum(update.shape[0]
+                       for update in iter_spilled(spill_folder))
+            logging.info("%-30s%d" % ("Total modified rows:", rows))
+            logging.info("Dry run, nothing inserted")
+            logging.info("-------------------------------------------------")
+            return rows
+
+        rows = 0
+        if new_categories:
+            new_categories = pd.concat(new_categories, ignore_index=True)
+        with stage("insert") as record, transaction() as cnx:
+            # Chunks may have given one new name different IDs
+            if len(new_categories):
+                created, ids = create(new_categories, cnx)
+            for update in iter_spilled(spill_folder):
+                if len(new_categories):
+                    update["CATEGORY"] = committed_ids(
+                        update["CATEGORY"], new_categories, ids)
+                insert_products(update, cnx)
+                rows += update.shape[0]
+            record["rows_in"] = record["rows_out"] = rows
+        if len(new_categories):
+            remember(ids)
+            log_data(created, paths["new_categories"])
+    if seen:
+        save_store(paths["fingerprints"],
+                   *(np.concatenate(part) for part in zip(*seen)))
+    logging.info("%-30s%d" % ("Total modified rows:", rows))
+    logging.info("-------------------------------------------------")
+    return rows
+
+def timed_run(update_path, options):
+    """ `run` returning (modified rows, seconds) """
+    import time
+
+    start = time.time()
+    rows = run(update_path, **options)
+    return rows, time.time() - start
+
+def run_batch(update_paths, options={}):
+    """
+    Runs the update files one after another, in the given order: each
+    run decides on `products` as left by the previous one (files at the
+    same time only with `--concurrent`).
+    A failing file does not stop the others.
+    Returns {filename: (modified rows, seconds, error)}
+    """
+    results = dict()
+    for path in update_paths:
+        try:
+            rows, seconds = timed_run(path, options)
+            results[op.basename(path)] = (rows, seconds, None)
+        except (Exception, SystemExit) as e:
+            error = "%s: %s" % (type(e).__name__, e)
+            logging.error("%-30s%s" % (op.basename(path), error))
+            results[op.basename(path)] = (0, 0., error)
+    return results
+
+def run_concurrent(update_paths, workers=None, full=True):
+    """
+    Applies the update files at the same time, safely next to other
+    runs (see `updater.coordinator`): files are read & checked one after
+    another, then decided & inserted shard by shard in `workers` threads.
+    `full` is passed to `read_update_fields`, fingerprints of files
+    applied without errors are stored in file order.
+    Returns {filename: (modified rows, seconds, error)}
+    """
+    import time
+    from updater.coordinator import file_hash, apply_files
+    from updater.db_connect import set_read_only
+    from updater.fingerprints import save_store
+    from updater.metrics import start_run, write_report
+    from updater import categories
+
+    set_read_only(False)
+    start_run()
+    categories.start_run()
+    start = time.time()
+    files, errors, seen = [], dict(), dict()
+    for path in update_paths:
+        try:
+            paths = log_paths(path)
+            # Decisions & categories of the shards are appended
+            for name in ("skip_rows", "insert_rows", "update_rows",
+                         "new_categories"):
+                if op.exists(paths[name]):
+                    os.remove(paths[name])
+            update, new_categories, fingerprints = read_update_fields(
+                paths, full=full)
+            seen[op.basename(path)] = (paths["fingerprints"], fingerprints)
+            files.append((op.basename(path), file_hash(path), paths, update,
+                          new_categories))
+        except (Exception, SystemExit) as e:
+            errors[op.basename(path)] = "%s: %s" % (type(e).__name__, e)
+            logging.error("%-30s%s" % (op.basename(path),
+                                       errors[op.basename(path)]))
+
+    applied = apply_files(files, workers)
+    seconds = time.time() - start
+    results = dict()
+    for path in update_paths:
+        filename = op.basename(path)
+        if filename in errors:
+            results[filename] = (0, 0., errors[filename])
+        else:
+            rows, shard_errors = applied[filename]
+            results[filename] = (rows, seconds,
+                                 "; ".join(shard_errors) or None)
+            if not shard_errors:
+                store_path, fingerprints = seen[filename]
+                save_store(store_path, *fingerprints)
+    write_report(op.join("logging", "concurrent_report.json"),
+                 files=update_paths, workers=workers, full=full,
+                 rows={file: rows for file, (rows, _, _) in results.items()})
+    return results
+
+def log_summary(results):
+    """ Logs modified rows, timing & failures per file """
+    logging.info("%-40s%10s%10s  %s" % ("File", "Rows", "Seconds", "Error"))
+    for file, (rows, seconds, error) in results.items():
+        logging.info("%-40s%10d%10.2f  %s" %
+            (file, rows, seconds, error or ""))
+    failed = sum(error is not None for _, _, error in results.values())
+    logging.info("%-30s%d" % ("Processed files:", len(results) - failed))
+    logging.info("%-30s%d" % ("Failed files:", failed))
 
-    # Leave only insert & update data
-    update = update[update["decision"] != "skip"].drop("decision", axis=1)
-    # Format columns & insert data
-    update = prepare_to_insert(update)
-    if not isinstance(new_categories, type(None)):
-        from updater.inserter import log_data
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Update `products` from supplier files")
+    parser.add_argument("--files", nargs="+", metavar="FILE",
+                        help="update files to process without menu")
+    parser.add_argument("--all", metavar="DIR", nargs="?", const="input",
+                        help="process every `.csv` of DIR without menu "
+                             "(default: `input`)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="threads for --concurrent "
+                             "(default: CPU count + 4, at most 32)")
+    parser.add_argument("--server-decision", action="store_true",
+                        help="read only `products` matching the keys "
+                             "of the file instead of the whole table")
+    parser.add_argument("--snapshot", action="store_true",
+                        help="keep `products` in a local snapshot and "
+                             "fetch only changed rows")
+    parser.add_argument("--resync", action="store_true",
+                        help="refetch the whole snapshot")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="decide without writing into MySQL: "
+                             "read-only connection, diff of inserts, "
+                             "updates, skips & new categories in "
+                             "`dry_run_diff.csv` of the logging folder")
+    parser.add_argument("--profile", action="store_true",
+                        help="profile each run (pyinstrument if "
+                             "installed, cProfile otherwise) into the "
+                             "logging folder")
+    parser.add_argument("--chunksize", type=int, default=None,
+                        help="out-of-core mode for files larger than "
+                             "memory: read & decide that many rows at "
+                             "a time")
+    parser.add_argument("--full", action="store_true",
+                        help="process every row, also rows unchanged "
+                             "since earlier runs "
+                             "(`logging/fingerprints.npz`)")
+    parser.add_argument("--overlap", action="store_true",
+                        help="fetch `products` & categories while the "
+                             "file is read & checked, write logs during "
+                             "the insert (without --chunksize)")
+    parser.add_argument("--concurrent", action="store_true",
+                        help="apply the files at the same time in "
+                             "threads, with row locks & a ledger of "
+                             "applied files in MySQL (safe next to "
+                             "other runs)")
+    parser.add_argument("--credentials", default="credentials.yml",
+                        help="database settings "
+                             "(default: `credentials.yml`)")
+    args = parser.parse_args()
+    if args.concurrent and (args.server_decision or args.snapshot or
+                            args.resync or args.dry_run or args.chunksize
+                            or args.overlap):
+        parser.error("--concurrent decides on locked rows, it cannot be "
+                     "combined with other modes")
+    options = {
+        "server_decision": args.server_decision,
+        "snapshot":        args.snapshot or args.resync,
+        "resync":          args.resync,
+        "chunksize":       args.chunksize,
+        "dry_run":         args.dry_run,
+        "profile":         args.profile,
+        "overlap":         args.overlap,
+        "full":            args.full,
+    }
 
-        log_data(new_categories, paths["new_categories"])
-        insert_categories(new_categories)
-    insert_products(update)
-    logging.info("-------------------------------------------------")
+    root = os.getcwd()
+    setup_logging(root)
+
+    update_paths = list(args.files or [])
+    if args.all:
+        update_paths += [op.join(args.all, file)
+                         for file in sorted(os.listdir(args.all))
+                         if ".csv" in file]
+    missing = [path for path in update_paths + [args.credentials]
+               if not op.exists(path)]
+    if missing:
+        logging.critical("No such file: %s" % ", ".join(missing))
+        sys.exit(1)
+
+    # Settings are read only once a file is chosen
+    from updater.db_connect import load_config, configure
+
+    if not update_paths:
+        filename = select_file(op.join(root, "input"))
+        update_paths = [op.join(root, "input", filename)]
+        if not args.concurrent:
+            configure(load_config(args.credentials))
+            run(update_paths[0], **options)
+            return
+
+    config = load_config(args.credentials)
+    configure(config)
+    if args.concurrent:
+        results = run_concurrent(update_paths, args.workers, args.full)
+    else:
+        results = run_batch(update_paths, options)
+    log_summary(results)
+    if any(error for _, _, error in results.values()):
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
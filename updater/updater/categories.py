@@ -0,0 +1,150 @@
+""" `NAME` -> `ID` cache of `categories`, kept for all runs of a process
+
+Loaded once (from `CATEGORY_CACHE` file if set, else the whole table),
+then refreshed only for names it does not know. Missing categories get
+new IDs and are inserted with the products, in the same transaction:
+`INSERT IGNORE` on the unique `NAME` and IDs read back, so concurrent
+runs agree on one ID per category. Only committed IDs are cached.
+"""
+import json
+import logging
+import os
+
+from .db_connect import get_config, read_sql, placeholder, dialect, \
+    insert_categories
+
+# Names in one `WHERE NAME IN (...)` query
+SELECT_BATCH = 1000
+# Locking read sees rows committed by other runs after our snapshot
+LOCKING_READ = {"mysql": " LOCK IN SHARE MODE", "sqlite": ""}
+
+# NAME -> ID of categories in the database
+IDS = dict()
+# NAME -> ID generated in the current dry run, never inserted
+PENDING = dict()
+# `DATABASE_URL` the cache was loaded from
+LOADED = None
+
+def load():
+    """ Fill the cache once per database """
+    global LOADED
+
+    config = get_config()
+    if LOADED == config["DATABASE_URL"]:
+        return
+    IDS.clear()
+    PENDING.clear()
+    path = config.get("CATEGORY_CACHE")
+    if path and os.path.exists(path):
+        with open(path, "r") as f:
+            IDS.update(json.load(f))
+        logging.info("%-30s%d" % ("Cached categories:", len(IDS)))
+    else:
+        from .db_connect import fetch_table
+
+        categories = fetch_table("categories", columns=["ID", "NAME"])
+        IDS.update(zip(categories["NAME"], categories["ID"]))
+        save()
+    LOADED = config["DATABASE_URL"]
+
+def save():
+    """ Write the cache into `CATEGORY_CACHE` file if set """
+    path = get_config().get("CATEGORY_CACHE")
+    if not path:
+        return
+    temp = "%s.%d.tmp" % (path, os.getpid())
+    with open(temp, "w") as f:
+        json.dump(IDS, f)
+    os.replace(temp, path)
+
+def select(names, cnx=None, lock=False):
+    """ `ID` & `NAME` of `names` in `categories` """
+    import pandas as pd
+
+    found = []
+    for start in range(0, len(names), SELECT_BATCH):
+        batch = list(names[start:start + SELECT_BATCH])
+        query = "SELECT ID, NAME FROM categories WHERE NAME IN (%s)%s;" % (
+            ", ".join([placeholder()] * len(batch)),
+            LOCKING_READ[dialect()] if lock else "")
+        found.append(read_sql(query, cnx, params=batch))
+    return pd.concat(found, ignore_index=True) if found else \
+        pd.DataFrame(columns=["ID", "NAME"])
+
+def refresh(names):
+    """ Add categories of `names` created since loading, e.g. by other runs """
+    found = select(names)
+    IDS.update(zip(found["NAME"], found["ID"]))
+    return found.shape[0]
+
+def start_run():
+    """ Forget IDs generated by earlier (dry) runs of the process """
+    PENDING.clear()
+
+def create(new, cnx):
+    """
+    Insert categories `new` (`ID` & `NAME` from `resolve`) within the
+    products transaction `cnx`, names inserted meanwhile by other runs
+    are skipped. Returns `ID` & `NAME` of categories created by this run
+    & {`NAME`: committed `ID`}, cached by `remember` after the commit.
+    """
+    unique = new.drop_duplicates("NAME")
+    insert_categories(unique, cnx, ignore=True)
+    found = select(unique["NAME"].tolist(), cnx, lock=True)
+    ids = dict(zip(found["NAME"], found["ID"]))
+    created = unique[unique["ID"] == unique["NAME"].map(ids)]
+    return created.reset_index(drop=True), ids
+
+def remember(ids):
+    """ Cache committed {`NAME`: `ID`} of `create` """
+    IDS.update(ids)
+    save()
+
+def committed_ids(category, new, ids):
+    """
+    `CATEGORY` column with IDs of `new` replaced by committed `ids`,
+    other runs may have inserted the same name first
+    """
+    replaced = {row_id: ids[name] for row_id, name
+                in zip(new["ID"], new["NAME"]) if ids[name] != row_id}
+    return category.replace(replaced) if replaced else category
+
+def reserve(names, pending=True):
+    """
+    New IDs for `names`, kept for the run in `PENDING` if `pending`
+    (dry run: never inserted)
+    """
+    import pandas as pd
+    from .schema import generate_ids
+
+    new = pd.DataFrame({"ID": generate_ids(len(names)),
+                        "NAME": list(names)})
+    if pending:
+        PENDING.update(zip(new["NAME"], new["ID"]))
+    return new
+
+def resolve(names, create_missing=True):
+    """
+    Category IDs of `names` (Series) mapped at once.
+    Missing categories get new IDs: inserted by `create` with the
+    products if `create_missing`, otherwise kept for the run only.
+    Returns (IDs, `ID` & `NAME` of new categories or None)
+    """
+    import pandas as pd
+
+    load()
+    # IDs of a dry run never stand for categories to insert
+    pending = PENDING if not create_missing else dict()
+    unique = pd.unique(names)
+    missing = [name for name in unique
+               if name not in IDS and name not in pending]
+    if missing:
+        refresh(missing)
+        missing = [name for name in missing if name not in IDS]
+
+    new = None
+    lookup = {name: IDS.get(name, pending.get(name)) for name in unique}
+    if missing:
+        new = reserve(missing, pending=not create_missing)
+        lookup.update(zip(new["NAME"], new["ID"]))
+    return names.map(lookup), new
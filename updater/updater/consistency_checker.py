@@ -1,61 +1,86 @@
 import logging
 import os
 
+import numpy as np
 import pandas as pd
 
 from .inserter import touch_folder, log_data
+from .schema import UPDATE_DTYPES, log_memory
 
-def read_update(path):
-    """ Reads update dataframe from `path` """
+def read_update(path, chunksize=None):
+    """
+    Reads update dataframe from `path`,
+    iterator of dataframes with `chunksize` rows if given
+    """
     usecols = ["id", "ean", "product_group", "colorn", "name",
                "pricepunit", "rrp"]
     try:
-        update = pd.read_csv(path, sep=";", encoding="cp1252", usecols=usecols)
+        update = pd.read_csv(path, sep=";", encoding="cp1252", usecols=usecols,
+                             dtype=UPDATE_DTYPES, chunksize=chunksize)
     except FileNotFoundError as e:
         logging.critical("No such file in `input` folder!")
         quit()
+    if chunksize:
+        return update
     logging.info("%-30s%d" % ("Input rows:", update.shape[0]))
+    log_memory("read", update)
     return update
 
-def consistency_check(row):
-    """ True if bad (not equal), False otherwise or if not wool """
-    if (900  <= row["product_group"] <=  999 or
-            9000 <= row["product_group"] <= 9999):
-        return False
-    else:
-        return 10000 * row["product_group"] + row["colorn"] != row["id"]
+def consistency_check(data):
+    """ True if bad (not equal or missing), False otherwise or if not wool """
+    group = data["product_group"].astype("Int64")
+    not_wool = group.between(900, 999) | group.between(9000, 9999)
+    bad = ~not_wool & (10000 * group + data["colorn"] != data["id"])
+    return bad.fillna(True).astype(bool)
+
+def name_column(data):
+    """ Converts `name` and `id` color part into `p_NAME` """
+    color = (data["id"] % 10000).astype(int).astype(str).str.zfill(4)
+    return data["name"].astype(str) + " " + color
 
-def name_column(row):
-    """ Converts `name` and `colorn` into `p_NAME` """
-    return "%s %04d" % (row["name"], row["id"] % 10000)
+def key_hashes(column):
+    """ 64-bit hash of each value, missing values hash alike """
+    return pd.util.hash_pandas_object(column, index=False).values
 
-def clean_input(data, save_filtered=None):
+def clean_input(data, save_filtered=None, dup_keys=None, append=False):
     """
         1) Creates `p_NAME`
         2) Checks consistency
         3) Checks if `ean` is missing
         4) Checks if any of `ean`, `id`, `p_NAME` has duplicates
-        5) Saves failed rows to log file
-        6) Outputs good rows, properly ordered.
+        5) Logs failed rows count per check
+        6) Saves failed rows to log file
+        7) Outputs good rows, properly ordered.
 
-    `save_filtered` is path of logging file """
+    `save_filtered` is path of logging file, `append` adds rows to it.
+    `dup_keys` - {column: hashes of values duplicated in the whole file}
+                 for data read in chunks, see `streaming.duplicate_keys`
+    """
 
     columns = data.columns.tolist()
-    data["p_NAME"]      = data.apply(name_column,       axis=1)
-    data["consistency"] = data.apply(consistency_check, axis=1)
+    data["p_NAME"]      = name_column(data)
+    data["consistency"] = consistency_check(data)
     # True if bad (null):
     data["ean_null"]    = data["ean"].isnull()
     for col in ("ean", "id", "p_NAME", ):
         # True if bad (duplicated):
-        data["%s_dup" % col] = data[col].duplicated(keep=False)
+        if dup_keys is None:
+            data["%s_dup" % col] = data[col].duplicated(keep=False)
+        else:
+            data["%s_dup" % col] = np.isin(key_hashes(data[col]),
+                                           dup_keys[col])
 
     check_columns = ["id_dup", "ean_dup", "p_NAME_dup",
                      "ean_null", "consistency"]
     data["fail"] = data[check_columns].any(1)
 
+    for col in check_columns:
+        logging.info("%-30s%d" % ("Failed %s:" % col, data[col].sum()))
+    logging.info("%-30s%d" % ("Failed rows:", data["fail"].sum()))
+
     if save_filtered:
         touch_folder(os.path.dirname(save_filtered))
-        log_data(data[data["fail"]], save_filtered)
+        log_data(data[data["fail"]], save_filtered, append)
 
     return data.loc[~data["fail"], columns + ["p_NAME"]]\
         .reset_index(drop=True)
@@ -0,0 +1,230 @@
+""" Several update files applied at the same time without lost updates
+
+Rows are split into shards by `REFERENCE`. Shards linked by rows that
+share `CODE` or `NAME` (as they match & upsert the same products) form
+one lane. Lanes run in a thread pool, each one applying the files in
+their given order, and every (file, shard) in one short transaction:
+1) `SELECT ... FOR UPDATE` of products matching the keys of the shard
+   (`staging.match_products`)
+2) decision against the locked rows, new categories of the shard &
+   upsert
+3) (file hash, shard) into the `update_ledger` table
+Other runs wait for the locked rows instead of deciding on stale
+products, deadlocks are retried, and a shard of a file already in the
+ledger is never applied twice.
+"""
+import hashlib
+import logging
+import random
+import threading
+import time
+
+import pandas as pd
+
+from .db_connect import transaction, read_sql, insert, insert_products, \
+    placeholder, dialect
+from .categories import create, remember, committed_ids
+from .inserter import decide_indexed, log_decided, log_data, \
+    prepare_to_insert
+from .staging import match_products, odd_keys, FOR_UPDATE
+
+LEDGER = "update_ledger"
+LEDGER_TABLE = """CREATE TABLE IF NOT EXISTS %s (
+    FILE_HASH CHAR(64) NOT NULL
+    , SHARD INT NOT NULL
+    , FILENAME VARCHAR(255) NOT NULL
+    , ROWS_MODIFIED INT NOT NULL
+    , APPLIED_AT TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    , PRIMARY KEY (FILE_HASH, SHARD))""" % LEDGER
+# Shard of a row: `REFERENCE` modulo `SHARDS`, the same in every run
+# of a file. Not `product_group`: `id` of groups 900-999 & 9000-9999 is
+# not tied to the group
+SHARDS = 32
+# SQLite has no row locks, its write lock is taken at `BEGIN IMMEDIATE`
+BEGIN = {"mysql": None, "sqlite": "BEGIN IMMEDIATE"}
+# Deadlock & lock wait timeout (MySQL)
+RETRY_CODES = (1213, 1205)
+RETRIES = 5
+RETRY_SECONDS = 0.2
+# Logs of a file & the category cache are shared by the shards
+LOG_LOCK = threading.Lock()
+
+def file_hash(path):
+    """ SHA-256 of file contents """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(2 ** 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def create_ledger():
+    """ Creates `update_ledger` if missing """
+    with transaction() as cnx:
+        cnx.cursor().execute(LEDGER_TABLE)
+
+def applied_shards(digest, cnx=None):
+    """ Shards of file with hash `digest` found in the ledger """
+    applied = read_sql("SELECT SHARD FROM %s WHERE FILE_HASH = %s;" %
+                       (LEDGER, placeholder()), cnx, [digest])
+    return set(applied["SHARD"].tolist())
+
+def retryable(error):
+    """ Deadlock or lock wait timeout, locked database for SQLite """
+    code = error.args[0] if error.args else None
+    return code in RETRY_CODES or "database is locked" in str(error)
+
+def apply_part(update, new_categories, shard, filename, digest, odd):
+    """
+    Decides & upserts `update` rows of one shard of a file in one
+    transaction, with `new_categories` (`ID` & `NAME` or None) they use.
+    `odd` - products with keys not stored as plain digits (`odd_keys`)
+    Returns decided rows, created categories & their committed
+    {`NAME`: `ID`}, or None if already applied.
+    """
+    with transaction() as cnx:
+        cursor = cnx.cursor()
+        if BEGIN[dialect()]:
+            cursor.execute(BEGIN[dialect()])
+        # Locking read: a second run of the same file waits here
+        cursor.execute("SELECT 1 FROM %s WHERE FILE_HASH = %s AND "
+                       "SHARD = %s%s;" % (LEDGER, placeholder(),
+                       placeholder(), FOR_UPDATE[dialect()]),
+                       (digest, shard))
+        applied = cursor.fetchall()
+        cursor.close()
+        if applied:
+            return None
+
+        decided = decide_indexed(update.reset_index(drop=True),
+                                 match_products(update, cnx, odd, lock=True),
+                                 None)
+        rows = prepare_to_insert(decided[decided["decision"] != "skip"]
+                                 .drop("decision", axis=1))
+        created, ids = None, dict()
+        if new_categories is not None:
+            created, ids = create(new_categories, cnx)
+            rows["CATEGORY"] = committed_ids(rows["CATEGORY"],
+                                             new_categories, ids)
+        insert_products(rows, cnx)
+        insert(pd.DataFrame([(digest, shard, filename, rows.shape[0])],
+                            columns=["FILE_HASH", "SHARD", "FILENAME",
+                                     "ROWS_MODIFIED"]), LEDGER, cnx=cnx)
+    return decided, created, ids
+
+def apply_with_retry(update, new_categories, shard, filename, digest, odd):
+    """ `apply_part` retried on deadlocks with growing random delay """
+    for attempt in range(RETRIES):
+        try:
+            return apply_part(update, new_categories, shard, filename,
+                              digest, odd)
+        except Exception as e:
+            if attempt == RETRIES - 1 or not retryable(e):
+                raise
+            logging.warning("%-30s%s, retry %d" % ("Shard %d of %s:" %
+                (shard, filename), e, attempt + 1))
+            time.sleep(RETRY_SECONDS * 2 ** attempt * (1 + random.random()))
+
+def shard_lanes(keys):
+    """
+    Shard & lane of each row of `keys` (`REFERENCE`, `CODE` & `NAME` of
+    all files). Lane is the smallest shard linked to the row by equal
+    keys or shards.
+    """
+    keys = keys.assign(SHARD=keys["REFERENCE"].astype("int64").values
+                       % SHARDS)
+    lane = keys["SHARD"].values.copy()
+    while True:
+        before = lane.copy()
+        for col in ["SHARD", "CODE", "NAME"]:
+            known = keys[col].notna().values
+            lane[known] = pd.Series(lane[known])\
+                .groupby(keys[col][known].values).transform("min").values
+        if (lane == before).all():
+            return keys["SHARD"].values, lane
+
+def shard_categories(new_categories, part):
+    """ New categories used by rows of `part`, None if there are none """
+    if new_categories is None:
+        return None
+    used = new_categories[new_categories["ID"].isin(part["CATEGORY"])]
+    return used if used.shape[0] else None
+
+def apply_lane(parts, odd):
+    """
+    Applies `parts` (filename, hash, log paths, shard, rows, new
+    categories) of one lane in order, `odd` as in `apply_part`.
+    Returns [(filename, modified rows, error)]
+    """
+    results = []
+    for filename, digest, paths, shard, update, new_categories in parts:
+        try:
+            applied = apply_with_retry(update, new_categories, shard,
+                                       filename, digest, odd)
+        except Exception as e:
+            error = "%s: %s" % (type(e).__name__, e)
+            logging.error("%-30s%s" % ("Shard %d of %s:" % (shard, filename),
+                                       error))
+            results.append((filename, 0, error))
+            continue
+        if applied is None:
+            logging.info("%-30s%s" % ("Shard %d of %s:" % (shard, filename),
+                                      "already applied"))
+            results.append((filename, 0, None))
+            continue
+        # Logged once committed, retries would log rows twice
+        decided, created, ids = applied
+        with LOG_LOCK:
+            remember(ids)
+            if created is not None and created.shape[0]:
+                log_data(created, paths["new_categories"], append=True)
+            log_decided(decided, paths, append=True)
+        rows = int((decided["decision"] != "skip").sum())
+        results.append((filename, rows, None))
+    return results
+
+def apply_files(files, workers=None):
+    """
+    Applies `files` [(filename, hash, log paths, cleaned rows with
+    fields, new categories or None)] lane by lane in a pool of `workers`
+    threads. Shards of a file found in the ledger are skipped.
+    Returns {filename: (modified rows, failed shards errors)}
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    create_ledger()
+    if not files:
+        return dict()
+    lanes = dict()
+    row_shards, row_lanes = shard_lanes(pd.concat(
+        [update[["REFERENCE", "CODE", "NAME"]] for _, _, _, update, _
+         in files], ignore_index=True))
+    start = 0
+    for filename, digest, paths, update, new_categories in files:
+        applied = applied_shards(digest)
+        if applied:
+            logging.info("%-30s%d" % ("Applied shards of %s:" % filename,
+                                      len(applied)))
+        end = start + update.shape[0]
+        # One lane per shard
+        parts = update.groupby([row_lanes[start:end], row_shards[start:end]],
+                               sort=True)
+        start = end
+        for (lane, shard), part in parts:
+            if int(shard) not in applied:
+                lanes.setdefault(int(lane), []).append(
+                    (filename, digest, paths, int(shard), part,
+                     shard_categories(new_categories, part)))
+    logging.info("%-30s%d" % ("Lanes to apply:", len(lanes)))
+    # Read once: the updater itself writes keys as plain digits
+    odd = odd_keys()
+
+    results = {filename: (0, []) for filename, _, _, _, _ in files}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(apply_lane, parts, odd)
+                   for parts in lanes.values()]
+        for future in futures:
+            for filename, rows, error in future.result():
+                total, errors = results[filename]
+                results[filename] = (total + rows,
+                                     errors + ([error] if error else []))
+    return results
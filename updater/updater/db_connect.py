@@ -1,93 +1,291 @@
 import os
+import time
 import logging
-import yaml
+import contextlib
 
-import pandas as pd
+from .metrics import count_round_trip
 
 encoding = "utf8"
+# SQLite limit of parameters in one statement
+SQLITE_MAX_VARIABLES = 32766
 
-root = os.getcwd()
-cred_path = os.path.join(root, "credentials.yml")
-with open(cred_path, "r") as f:
-    cred = yaml.load(f)
+# Optional settings of `credentials.yml`
+DEFAULTS = {
+    # Any SQLAlchemy URL instead of `openbravopos` on HOST,
+    # e.g. `sqlite:///bench.db` for benchmarks
+    "DATABASE_URL":      None,
+    # Connection pool
+    "POOL_SIZE":         5,
+    "POOL_RECYCLE":      3600,
+    "POOL_PRE_PING":     True,
+    # Bulk insert, `LOAD DATA LOCAL INFILE` is used from
+    # `LOCAL_INFILE_ROWS` rows on (0 disables it)
+    "INSERT_BATCH_SIZE": 5000,
+    "LOCAL_INFILE_ROWS": 0,
+    # JSON file keeping `categories` NAME -> ID between runs
+    "CATEGORY_CACHE":    None,
+}
 
-PSSWD = cred["MYSQL_PSSWD"]
-USER  = cred["MYSQL_USER"]
-HOST  = cred["HOST"]
+CONFIG = None
+ENGINE = None
+# Dry run: sessions are read-only and `products` & `categories`
+# inserts refuse to run
+READ_ONLY = False
+
+def load_config(path):
+    """ Settings of `credentials.yml` at `path`, with defaults """
+    import yaml
+
+    with open(path, "r") as f:
+        config = dict(DEFAULTS, **yaml.safe_load(f))
+    if not config["DATABASE_URL"]:
+        config["DATABASE_URL"] = \
+            "mysql+pymysql://%s:%s@%s/openbravopos?charset=%s" % (
+                config["MYSQL_USER"], config["MYSQL_PSSWD"],
+                config["HOST"], encoding)
+    return config
+
+def configure(config):
+    """ Use settings of `load_config` for connections of this process """
+    global CONFIG, ENGINE
+
+    if ENGINE is not None:
+        ENGINE.dispose()
+        ENGINE = None
+    CONFIG = config
+
+def get_config():
+    """ Settings passed to `configure`, raises if it was not called """
+    if CONFIG is None:
+        raise RuntimeError("No database settings: call "
+                           "`configure(load_config(path))` first")
+    return CONFIG
+
+def get_engine():
+    """ Create MySQL engine with connection pool once per process """
+    global ENGINE
+
+    if ENGINE is None:
+        import sqlalchemy
+        config = get_config()
+        url = config["DATABASE_URL"]
+        if url.startswith("sqlite"):
+            ENGINE = sqlalchemy.create_engine(url)
+            return ENGINE
+
+        connect_args = {"local_infile": bool(config["LOCAL_INFILE_ROWS"])}
+        if READ_ONLY:
+            # Temporary tables (server decision) stay writable
+            connect_args["init_command"] = \
+                "SET SESSION TRANSACTION READ ONLY"
+        ENGINE = sqlalchemy.create_engine(url,
+            pool_size=config["POOL_SIZE"],
+            pool_recycle=config["POOL_RECYCLE"],
+            pool_pre_ping=config["POOL_PRE_PING"],
+            connect_args=connect_args)
+    return ENGINE
+
+def dialect():
+    """ `mysql` or `sqlite` """
+    return get_engine().dialect.name
+
+def placeholder():
+    """ Query parameter marker of the driver """
+    return "?" if get_engine().dialect.paramstyle == "qmark" else "%s"
+
+def set_read_only(read_only=True):
+    """ Switch read-only mode, pooled connections are replaced """
+    global ENGINE, READ_ONLY
+
+    if read_only == READ_ONLY:
+        return
+    READ_ONLY = read_only
+    if ENGINE is not None:
+        ENGINE.dispose()
+        ENGINE = None
+
+def check_writable(table):
+    """ Raises if writing into `table` in read-only mode """
+    if READ_ONLY:
+        raise RuntimeError("Read-only (dry run): no rows are written "
+                           "into `%s`" % table)
 
 def connect():
-    """ Create MySQL engine """
+    """ Raw connection from the pool, `close` returns it to the pool """
     import sqlalchemy
-    engine = sqlalchemy.create_engine(
-        "mysql+pymysql://%s:%s@%s/openbravopos?charset=%s" %
-        (USER, PSSWD, HOST, encoding))
     try:
-        return engine.raw_connection()
+        return get_engine().raw_connection()
     except sqlalchemy.exc.OperationalError as e :
         logging.critical("Wrong credentials! "
             "Check credentials in `credentials.yml`.")
         quit()
 
-def read_sql(query):
-    """ Read query from MySQL """
+@contextlib.contextmanager
+def transaction():
+    """ Connection committed on success, rolled back on error """
     cnx = connect()
-    data = pd.read_sql(query, cnx)
-    cnx.close()
-    return data
+    try:
+        yield cnx
+        cnx.commit()
+    except BaseException:
+        cnx.rollback()
+        raise
+    finally:
+        cnx.close()
+
+def read_sql(query, cnx=None, params=None):
+    """ Read query from MySQL, using `cnx` if given """
+    import pandas as pd
+
+    count_round_trip()
+    if cnx is not None:
+        return pd.read_sql(query, cnx, params=params)
+    cnx = connect()
+    try:
+        return pd.read_sql(query, cnx, params=params)
+    finally:
+        cnx.close()
 
-def fetch_table(table_name, columns=["*", ]):
+def fetch_table(table_name, columns=["*", ], cnx=None):
     """ Select `columns` from table in MySQL """
     cols = ", ".join(columns)
     query = "SELECT %s FROM %s;" % (cols, table_name)
-    data = read_sql(query)
+    data = read_sql(query, cnx)
     logging.info("%-30s%d" %
         ("Items in %s:" % table_name, data.shape[0]))
     return data
 
-def insert_products(data):
-    query = """INSERT INTO products
-        (id
-         , reference
-         , code
-         , name
-         , pricebuy
-         , pricesell
-         , category
-         , taxcat
-         , iscom
-         , isscale)
-
-    VALUES (
-        %(ID)s, %(REFERENCE)s, %(CODE)s, %(NAME)s,
-        %(PRICEBUY)s, %(PRICESELL)s, %(CATEGORY)s,
-        %(TAXCAT)s, %(ISCOM)s, %(ISSCALE)s
-    ) ON DUPLICATE KEY UPDATE
+PRODUCT_COLUMNS = ["ID", "REFERENCE", "CODE", "NAME", "PRICEBUY",
+                   "PRICESELL", "CATEGORY", "TAXCAT", "ISCOM", "ISSCALE"]
+PRODUCT_UPSERT = {
+    "mysql": """ON DUPLICATE KEY UPDATE
         pricebuy = VALUES(pricebuy)
         , pricesell = VALUES(pricesell)
-    ;
-    """
-    insert(data, query)
+    """,
+    # SQLite 3.35+, fires on any unique key as in MySQL
+    "sqlite": """ON CONFLICT DO UPDATE SET
+        pricebuy = excluded.pricebuy
+        , pricesell = excluded.pricesell
+    """,
+}
+
+INSERT_IGNORE = {"mysql": "INSERT IGNORE", "sqlite": "INSERT OR IGNORE"}
+
+def insert_products(data, cnx=None, batch_size=None, commit_batches=False):
+    """ Insert or update prices of `data` rows in `products` """
+    check_writable("products")
+    data = data[PRODUCT_COLUMNS]
+    upsert = PRODUCT_UPSERT[dialect()]
+    infile_rows = get_config()["LOCAL_INFILE_ROWS"]
+    if infile_rows and data.shape[0] >= infile_rows and \
+            dialect() == "mysql":
+        load_data(data, "products", upsert, cnx)
+    else:
+        insert(data, "products", upsert, cnx,
+               batch_size, commit_batches)
+
+def insert_categories(data, cnx=None, ignore=False):
+    """ Insert `data` rows into `categories`, skip existing if `ignore` """
+    check_writable("categories")
+    insert(data[["ID", "NAME"]], "categories", cnx=cnx, ignore=ignore)
 
-def insert_categories(data):
-    query = """INSERT INTO categories (ID, NAME)
-    VALUES (%(ID)s, %(NAME)s)
-    ;
+def column_values(column):
+    """ Python values of column, `None` for missing """
+    return column.astype(object).where(column.notnull(), None).tolist()
+
+def table_rows(data):
+    """ Row tuples taken from column arrays """
+    return list(zip(*[column_values(data[col]) for col in data.columns]))
+
+def insert(data, table, suffix="", cnx=None, batch_size=None,
+           commit_batches=False, ignore=False):
     """
-    insert(data, query)
+    Insert `data` into `table` with multi-row `VALUES` statements of
+    `batch_size` rows. Uses own transaction if `cnx` is None, otherwise
+    commits after each batch only if `commit_batches`.
+    `ignore` skips rows conflicting with a unique key.
+    """
+    if cnx is None:
+        with transaction() as cnx:
+            return insert(data, table, suffix, cnx,
+                          batch_size, commit_batches, ignore)
+
+    batch_size = batch_size or get_config()["INSERT_BATCH_SIZE"]
+    if dialect() == "sqlite":
+        batch_size = min(batch_size, SQLITE_MAX_VARIABLES // data.shape[1])
+    verb = INSERT_IGNORE[dialect()] if ignore else "INSERT"
+    columns = ", ".join(data.columns)
+    placeholders = "(%s)" % ", ".join([placeholder()] * data.shape[1])
+    rows = table_rows(data)
 
-def insert(data, query):
-    """ Insert data into table """
-    cnx = connect()
     cursor = cnx.cursor()
+    for start in range(0, len(rows), batch_size):
+        timer = time.time()
+        batch = rows[start:start + batch_size]
+        query = "%s INTO %s (%s) VALUES %s %s;" % (verb, table, columns,
+            ", ".join([placeholders] * len(batch)), suffix)
+        cursor.execute(query, [value for row in batch for value in row])
+        count_round_trip()
+        if commit_batches:
+            cnx.commit()
+        logging.info("%-30s%d rows, %.2f s" %
+            ("Batch %d into %s:" % (start // batch_size + 1, table),
+             len(batch), time.time() - timer))
+    cursor.close()
 
-    rows = list()
-    for i, row in data.iterrows():
-        rows.append(row.to_dict())
+def infile_field(value):
+    """ Value as `LOAD DATA` field with default escaping """
+    if value is None:
+        return "\\N"
+    if isinstance(value, bytes):
+        value = int.from_bytes(value, "big")
+    return str(value).replace("\\", "\\\\")\
+        .replace("\t", "\\t").replace("\n", "\\n")
 
-    cursor.executemany(query, rows)
-    cursor.close()
-    cnx.commit()
-    cnx.close()
+def load_data(data, table, suffix="", cnx=None):
+    """
+    Fast path for large loads: `LOAD DATA LOCAL INFILE` into temporary
+    copy of `table`, then `INSERT ... SELECT` with `suffix`.
+    Needs `local_infile` enabled on server and `LOCAL_INFILE_ROWS` set.
+    """
+    import tempfile
+
+    if cnx is None:
+        with transaction() as cnx:
+            return load_data(data, table, suffix, cnx)
+
+    timer = time.time()
+    # Bit columns (bytes values) are loaded through user variables
+    bit_columns = [col for col in data.columns if data.shape[0] and
+                   isinstance(data[col].iloc[0], bytes)]
+    targets = ", ".join("@%s" % col if col in bit_columns else col
+                        for col in data.columns)
+    assignments = ", ".join("%s = CAST(@%s AS UNSIGNED)" % (col, col)
+                            for col in bit_columns)
+    columns = ", ".join(data.columns)
+    staging = "%s_load" % table
+
+    with tempfile.NamedTemporaryFile("w", encoding=encoding, newline="\n",
+                                     suffix=".tsv", delete=False) as f:
+        for row in table_rows(data):
+            f.write("\t".join(map(infile_field, row)) + "\n")
+    try:
+        cursor = cnx.cursor()
+        cursor.execute("DROP TEMPORARY TABLE IF EXISTS %s;" % staging)
+        cursor.execute("CREATE TEMPORARY TABLE %s LIKE %s;" %
+            (staging, table))
+        cursor.execute("""LOAD DATA LOCAL INFILE %%s INTO TABLE %s
+            CHARACTER SET %s (%s) %s;""" % (staging, encoding, targets,
+                "SET " + assignments if assignments else ""), (f.name, ))
+        cursor.execute("INSERT INTO %s (%s) SELECT %s FROM %s %s;" %
+            (table, columns, columns, staging, suffix))
+        cursor.execute("DROP TEMPORARY TABLE %s;" % staging)
+        cursor.close()
+        count_round_trip(5)
+    finally:
+        os.remove(f.name)
+    logging.info("%-30s%d rows, %.2f s" %
+        ("Loaded into %s:" % table, data.shape[0], time.time() - timer))
 
 if __name__ == "__main__":
     pass
@@ -0,0 +1,78 @@
+""" Fingerprints of update rows applied by earlier runs
+
+The store keeps for each `id` the hash of the row last applied (`id`,
+`ean`, `name`, `colorn`, `pricepunit`, `rrp`). Rows of the next file
+with the same fingerprint skip checks & decisions. Keyed by `id`, so a
+row changed & changed back is seen as changed, and files of different
+suppliers share one store.
+"""
+import os
+import os.path as op
+import logging
+
+import numpy as np
+import pandas as pd
+
+from .consistency_checker import name_column, key_hashes
+
+FINGERPRINT_COLUMNS = ["id", "ean", "name", "colorn", "pricepunit", "rrp"]
+
+def fingerprints(data):
+    """ (`id` hashes, row hashes) of update rows """
+    rows = pd.util.hash_pandas_object(data[FINGERPRINT_COLUMNS],
+                                      index=False).values
+    return key_hashes(data["id"]), rows
+
+def load_store(path):
+    """ (sorted `id` hashes, row hashes) saved at `path`, empty if none """
+    if not op.exists(path):
+        empty = np.array([], dtype=np.uint64)
+        return empty, empty
+    with np.load(path) as store:
+        return store["keys"], store["rows"]
+
+def save_store(path, keys, rows):
+    """ Adds fingerprints to the store at `path`, replacing known `id`s """
+    old_keys, old_rows = load_store(path)
+    # First occurrence wins: new fingerprints before stored ones
+    keys, first = np.unique(np.concatenate([keys, old_keys]),
+                            return_index=True)
+    rows = np.concatenate([rows, old_rows])[first]
+    tmp_path = "%s.%d.tmp.npz" % (op.splitext(path)[0], os.getpid())
+    np.savez(tmp_path, keys=keys, rows=rows)
+    os.replace(tmp_path, path)
+    logging.info("%-30s%d" % ("Stored fingerprints:", keys.shape[0]))
+
+def duplicated_rows(data, dup_keys=None):
+    """
+    True where `ean`, `id` or `p_NAME` is duplicated in the file, as
+    `clean_input` flags them. `dup_keys` for data read in chunks.
+    """
+    columns = {"ean": data["ean"], "id": data["id"],
+               "p_NAME": name_column(data)}
+    duplicated = np.zeros(data.shape[0], dtype=bool)
+    for col, column in columns.items():
+        if dup_keys is None:
+            duplicated |= column.duplicated(keep=False).values
+        else:
+            duplicated |= np.isin(key_hashes(column), dup_keys[col])
+    return duplicated
+
+def skip_unchanged(data, store, dup_keys=None):
+    """
+    Drops rows found with the same fingerprint in `store` (`load_store`),
+    unless one of their keys is duplicated in the file.
+    Returns changed rows & (`id` hashes, row hashes) of unchanged rows
+    """
+    keys, rows = fingerprints(data)
+    store_keys, store_rows = store
+    if store_keys.shape[0]:
+        found = np.searchsorted(store_keys, keys)\
+            .clip(max=store_keys.shape[0] - 1)
+        unchanged = (store_keys[found] == keys) & (store_rows[found] == rows)
+        unchanged &= ~duplicated_rows(data, dup_keys)
+    else:
+        unchanged = np.zeros(data.shape[0], dtype=bool)
+    logging.info("%-30s%d" % ("Unchanged rows:", unchanged.sum()))
+    return data[~unchanged].reset_index(drop=True), \
+        (keys[unchanged], rows[unchanged])
@@ -2,6 +2,7 @@ import os
 import os.path as op
 import logging
 
+import numpy as np
 import pandas as pd
 
 def touch_folder(path):
@@ -10,13 +11,18 @@ def touch_folder(path):
         return
     os.mkdir(path)
 
-def log_data(data, path):
-    """ Save dataframe into `.csv` file if it has rows """
+def log_data(data, path, append=False):
+    """
+    Save dataframe into `.csv` file if it has rows.
+    `append` adds rows to existing file (header only for a new file).
+    """
     import csv
 
     if data.shape[0] > 0:
+        header = not (append and op.exists(path))
         data.to_csv(path, index=False, encoding="cp1252", sep=";",
-                    quoting=csv.QUOTE_NONNUMERIC)
+                    quoting=csv.QUOTE_NONNUMERIC,
+                    mode="a" if append else "w", header=header)
         logging.info("Saved `%s`" % op.split(path)[1])
     else:
         return
@@ -31,6 +37,19 @@ def duplicate_ind(update, products, col):
     update[flag_col] = (update[flag_col] != "left_only")
     return update
 
+def price_rules(update, col):
+    """ Set `col_ind` to `same`, `lower`, `higher` comparing `col_prod` """
+    rules = {
+        "same":   "==",
+        "lower":  "<",
+        "higher": ">",
+    }
+    for rule, op in rules.items():
+        ix = eval("update[col]%supdate[col+'_prod']" % op)
+        update.loc[ix, col + "_ind"] = rule
+
+    return update
+
 def price_ind(col, update, products):
     """
     1) Merge `update` rows with both `REFERENCE` and `CODE`
@@ -39,37 +58,95 @@ def price_ind(col, update, products):
     3) Return `update` with `price_ind` & `price_prod` columns
     """
 
-    ind_columns = ["REFERENCE_dup", "CODE_dup"]
-    ix = update[ind_columns].all(1)
-
     header_columns = ["REFERENCE", "CODE"]
     columns = header_columns + [col]
     update = update.merge(products[columns], on=header_columns,
                           how="left", suffixes=["", "_prod"])
 
-    rules = {
-        "same":   "==",
-        "lower":  "<",
-        "higher": ">",
+    return price_rules(update, col)
+
+def expand_matches(update, counts, prices):
+    """
+    Build the columns & rows of the merges in `decide_before_insert`
+    from matches found in `products_index`:
+    `counts` - products count matching `REFERENCE`, `NAME`, `CODE`
+               of each `update` row (aligned with `update`)
+    `prices` - `PRICEBUY` & `PRICESELL` of products matching both
+               `REFERENCE` and `CODE`, `row` is position in `update`
+    """
+    # Rows are repeated as a merge with non-unique keys would do
+    repeat = np.ones(update.shape[0], dtype=int)
+    for col in ("REFERENCE", "NAME", "CODE", ):
+        repeat *= np.maximum(counts[col].values, 1)
+    rows = np.repeat(np.arange(update.shape[0]), repeat)
+    update = update.iloc[rows].reset_index(drop=True)
+
+    for col in ("REFERENCE", "NAME", "CODE", ):
+        update["%s_dup" % col] = counts[col].values[rows] > 0
+
+    # Rename `NAME` if it exists with different `CODE` & `REFERENCE`
+    ix = update["NAME_dup"] & \
+         ~update[["REFERENCE_dup", "CODE_dup"]].any(1)
+
+    update["NAME"] = update["NAME"].where(~ix, "#" + update["NAME"])
+
+    update["row"] = rows
+    if prices["row"].is_unique:
+        prices = prices.set_index("row")
+        for col in ("PRICEBUY", "PRICESELL", ):
+            update[col + "_prod"] = update["row"].map(prices[col])
+            price_rules(update, col)
+    else:
+        for col in ("PRICEBUY", "PRICESELL", ):
+            update = update.merge(prices[["row", col]], on="row",
+                                  how="left", suffixes=["", "_prod"])
+            price_rules(update, col)
+    return update.drop("row", axis=1)
+
+def log_decisions(update, paths, append=False):
+    """
+    Decision for each row:
+     - skip if one of `REFERENCE` AND `CODE` matches
+        and the other does not
+     - insert if neither `REFERENCE` nor `CODE` match
+     - update if both `REFERENCE` and `CODE` match
+    Logs rows of each decision (added to the logs if `append`), nothing
+    if `paths` is None.
+    Returns `update` with `decision` column.
+    """
+    price_cols = ["PRICEBUY_ind", "PRICESELL_ind"]
+    # Decision for each row
+    check_columns = ["REFERENCE_dup", "CODE_dup", ]
+    decisions = {
+        "skip":   (update["REFERENCE_dup"] != update["CODE_dup"]) | # bad
+                  (update[price_cols] == "same").all(1),    # already exists
+        "insert": ~update[check_columns].any(1),            # x = 0, y = 0
+        "update":  update[check_columns].all(1) &           # x = 1, y = 1
+                  (update[price_cols] != "same").any(1), # changed existing
     }
-    for rule, op in rules.items():
-        ix = eval("update[col]%supdate[col+'_prod']" % op)
-        update.loc[ix, col + "_ind"] = rule
 
+    for decision, ix in decisions.items():
+        update.loc[ix, "decision"] = decision
+
+    if paths is not None:
+        log_decided(update, paths, append)
     return update
 
+def log_decided(update, paths, append=False):
+    """ Logs rows of each decision of `update` as tables """
+    for decision in ("skip", "insert", "update", ):
+        tmp = update[update["decision"] == decision].drop("decision", axis=1)
+        logging.info("%-30s%d" % ("%-6s rows:" % decision, tmp.shape[0]))
+        log_data(tmp, paths["%s_rows" % decision], append)
+
 def decide_before_insert(update, products, paths):
     """
     1) Create in `update` indicators for `REFERENCE`,
        `NAME` & `CODE` if the row already exists in `products`
     2) Adds "#" before `NAME` if that `NAME` already exists with
        different `REFERENCE` & `CODE`
-    3) Decision:
-     - skip if one of `REFERENCE` AND `CODE` matches
-        and the other does not
-     - insert if neither `REFERENCE` nor `CODE` match
-     - update if both `REFERENCE` and `CODE` match
-     4) Return `update` with `decision` column and aux columns
+    3) Decision (see `log_decisions`)
+    4) Return `update` with `decision` column and aux columns
      """
 
     # Create flags for `REFERENCE`, `CODE, & `NAME`
@@ -86,26 +163,76 @@ def decide_before_insert(update, products, paths):
     for col in ("PRICEBUY", "PRICESELL", ):
         update = price_ind(col, update, products)
 
-    price_cols = ["PRICEBUY_ind", "PRICESELL_ind"]
-    # Decision for each row
-    check_columns = ["REFERENCE_dup", "CODE_dup", ]
-    decisions = {
-        "skip":   (update["REFERENCE_dup"] != update["CODE_dup"]) | # bad
-                  (update[price_cols] == "same").all(1),    # already exists
-        "insert": ~update[check_columns].any(1),            # x = 0, y = 0
-        "update":  update[check_columns].all(1) &           # x = 1, y = 1
-                  (update[price_cols] != "same").any(1), # changed existing
+    return log_decisions(update, paths)
+
+def products_index(products):
+    """
+    Hash indexes over `products`: match counts of `REFERENCE`, `NAME`,
+    `CODE` values and the (`REFERENCE`, `CODE`) pair index
+    """
+    index = {
+        col: products[col].value_counts(dropna=False)
+        for col in ("REFERENCE", "NAME", "CODE", )
     }
+    index["pairs"] = pd.MultiIndex.from_arrays(
+        [products["REFERENCE"], products["CODE"]])
+    return index
 
-    for decision, ix in decisions.items():
-        update.loc[ix, "decision"] = decision
+def decide_indexed(update, products, paths, index=None, append=False):
+    """
+    Same result & logs as `decide_before_insert`, computed with hash
+    lookups into `products_index` instead of five merges.
+    `paths` None decides without logging, `append` adds to the logs.
+    """
+    index = index or products_index(products)
+    counts = pd.DataFrame({
+        col: update[col].map(index[col]).fillna(0).astype(int).values
+        for col in ("REFERENCE", "NAME", "CODE", )
+    })
 
-        # Log decisions as tables
-        tmp = update[update["decision"] == decision].drop("decision", axis=1)
-        logging.info("%-30s%d" % ("%-6s rows:" % decision, tmp.shape[0]))
-        log_data(tmp, paths["%s_rows" % decision])
+    price_columns = ["PRICEBUY", "PRICESELL"]
+    if index["pairs"].is_unique:
+        positions = index["pairs"].get_indexer(pd.MultiIndex.from_arrays(
+            [update["REFERENCE"], update["CODE"]]))
+        rows = np.flatnonzero(positions >= 0)
+        prices = products[price_columns].iloc[positions[rows]]\
+            .reset_index(drop=True)
+        prices["row"] = rows
+    else:
+        # Same pair several times in products: keep all matches in order
+        keys = update[["REFERENCE", "CODE"]].copy()
+        keys["row"] = np.arange(update.shape[0])
+        prices = keys.merge(products[["REFERENCE", "CODE"] + price_columns],
+                            on=["REFERENCE", "CODE"])\
+            [["row"] + price_columns].sort_values("row", kind="mergesort")
 
-    return update
+    update = expand_matches(update, counts, prices)
+    return log_decisions(update, paths, append)
+
+DIFF_COLUMNS = ["action", "REFERENCE", "CODE", "NAME",
+                "PRICEBUY_old", "PRICEBUY", "PRICESELL_old", "PRICESELL"]
+
+def decision_diff(update, new_categories=None):
+    """
+    Compact diff of decided `update`: `action` (insert, update, skip)
+    with keys and old -> new prices of each row, then `new category`
+    rows with category name in `NAME`
+    """
+    diff = update.rename(columns={
+        "decision":       "action",
+        "PRICEBUY_prod":  "PRICEBUY_old",
+        "PRICESELL_prod": "PRICESELL_old",
+    })[DIFF_COLUMNS]
+    if new_categories is not None:
+        diff = pd.concat([diff, category_diff(new_categories)],
+                         ignore_index=True)
+    return diff
+
+def category_diff(new_categories):
+    """ `new category` diff rows with category name in `NAME` """
+    return pd.DataFrame({"action": "new category",
+                         "NAME":   new_categories["NAME"]},
+                        columns=DIFF_COLUMNS)
 
 def prepare_to_insert(data):
     """
@@ -0,0 +1,49 @@
+""" Stage metrics of `parse_konto/metrics.py` plus DB round trips
+
+    with stage("read") as record:
+        data = read(...)
+        record["rows_out"] = data.shape[0]
+
+Stages record the round trips sent during them, `add_count` totals
+(e.g. rows skipped by a shortcut) are saved as "counts" of the report.
+"""
+import importlib.util
+import os.path as op
+
+BASE_PATH = op.abspath(op.join(__file__, op.pardir, op.pardir, op.pardir,
+                               "parse_konto", "metrics.py"))
+
+def load_base():
+    """ `parse_konto/metrics.py`, kept apart from a `metrics` on the path """
+    spec = importlib.util.spec_from_file_location("konto_metrics", BASE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+BASE = load_base()
+stage = BASE.stage
+profiled = BASE.profiled
+process_peak_rss_mb = BASE.process_peak_rss_mb
+
+COUNTS = dict()
+ROUND_TRIPS = 0
+BASE.COUNTERS["db_round_trips"] = lambda: ROUND_TRIPS
+
+def start_run():
+    """ Forget stages & counts of previous run """
+    COUNTS.clear()
+    BASE.start_run()
+
+def count_round_trip(count=1):
+    """ Called for each query sent to MySQL """
+    global ROUND_TRIPS
+
+    ROUND_TRIPS += count
+
+def add_count(name, count):
+    """ Adds `count` to run total `name`, e.g. rows skipped by a shortcut """
+    COUNTS[name] = COUNTS.get(name, 0) + int(count)
+
+def write_report(path, **info):
+    """ Saves `info`, counts & recorded stages as JSON into `path` """
+    BASE.write_report(path, counts=COUNTS, **info)
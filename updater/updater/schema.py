@@ -0,0 +1,78 @@
+import os
+import logging
+
+import numpy as np
+import pandas as pd
+
+# Column types of update files.
+# `ean` & `id` are exact integers (13-digit EANs lose nothing),
+# nullable `Int` types keep missing values without falling back to float
+UPDATE_DTYPES = {
+    "id":            "int64",
+    "ean":           "Int64",
+    "product_group": "Int32",
+    "colorn":        "Int32",
+    "name":          "category",
+    "pricepunit":    "float64",
+    "rrp":           "float64",
+}
+# Digits of generated `ID` values
+HEX_DIGITS = b"0123456789abcdef"
+
+def generate_ids(n):
+    """ `n` random UUID4 strings (`ID` values) generated at once """
+    hex_digits = np.frombuffer(HEX_DIGITS, dtype=np.uint8)
+    raw = np.frombuffer(os.urandom(16 * n), dtype=np.uint8)\
+        .reshape(n, 16).copy()
+    raw[:, 6] = (raw[:, 6] & 0x0f) | 0x40 # version 4
+    raw[:, 8] = (raw[:, 8] & 0x3f) | 0x80 # RFC 4122 variant
+
+    digits = np.empty((n, 32), dtype=np.uint8)
+    digits[:, 0::2] = hex_digits[raw >> 4]
+    digits[:, 1::2] = hex_digits[raw & 0x0f]
+
+    # 8-4-4-4-12 groups separated by dashes
+    text = np.full((n, 36), ord("-"), dtype=np.uint8)
+    for start, end, shift in ((0, 8, 0), (8, 12, 1), (12, 16, 2),
+                              (16, 20, 3), (20, 32, 4)):
+        text[:, start + shift:end + shift] = digits[:, start:end]
+    return text.view("S36").ravel().astype(str).astype(object)
+
+def string_dtype():
+    """ Arrow backed strings if `pyarrow` is installed, objects otherwise """
+    try:
+        import pyarrow
+    except ImportError:
+        return object
+    return "string[pyarrow]"
+
+def integer_codes(column):
+    """ `CODE` values as `Int64`, missing if not an integral number """
+    if pd.api.types.is_numeric_dtype(column):
+        return column.astype("Int64")
+    # Parsed from text, floats would round codes longer than 15 digits.
+    # Codes written from float columns end with ".0"
+    digits = column.astype(str).str.strip()\
+        .str.extract(r"^(\d{1,18})(?:\.0*)?$", expand=False)
+    found = digits.notna()
+    values = np.zeros(column.shape[0], dtype="int64")
+    values[found.values] = pd.to_numeric(digits[found]).values
+    return pd.Series(pd.arrays.IntegerArray(values, ~found.values),
+                     index=column.index)
+
+def products_frame(products):
+    """ Types `REFERENCE`, `CODE`, `NAME` & `PRICESELL` of `products` """
+    products["REFERENCE"] = products["REFERENCE"].astype("int64")
+    products["CODE"]      = integer_codes(products["CODE"])
+    products["NAME"]      = products["NAME"].astype(string_dtype())
+    products["PRICESELL"] = products["PRICESELL"].round(13)
+    return products
+
+def memory_mb(data):
+    """ Deep memory usage of dataframe in MB """
+    return data.memory_usage(index=True, deep=True).sum() / 2 ** 20
+
+def log_memory(stage, data):
+    """ Logs memory of dataframe after `stage` """
+    logging.info("%-30s%.1f MB, %d rows" %
+        ("Memory %s:" % stage, memory_mb(data), data.shape[0]))
@@ -0,0 +1,88 @@
+import os
+import os.path as op
+import logging
+
+import pandas as pd
+
+from .db_connect import connect, read_sql, placeholder
+
+SNAPSHOT_COLUMNS = ["ID", "REFERENCE", "CODE", "NAME",
+                    "PRICEBUY", "PRICESELL"]
+# 60 bit checksum of snapshot columns, `\N` marks NULL
+CHECKSUM = """CAST(CONV(LEFT(MD5(CONCAT_WS('|', %s)), 15), 16, 10)
+    AS UNSIGNED) AS CHECKSUM""" % ", ".join(
+        "IFNULL(%s, '\\\\N')" % col for col in SNAPSHOT_COLUMNS[1:])
+ID_BATCH = 1000
+
+def read_snapshot(path):
+    """
+    Feather snapshot as memory-mapped Arrow table: pages are read when
+    a column is used, `to_pandas` copies into memory
+    """
+    import pyarrow.feather as feather
+
+    return feather.read_table(path, memory_map=True)
+
+def write_snapshot(data, path):
+    """ Atomically replace Feather snapshot """
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    data.reset_index(drop=True).to_feather(tmp_path)
+    os.replace(tmp_path, path)
+
+def fetch_rows(cnx, ids=None):
+    """ Snapshot columns & checksum of all products or of `ids` """
+    query = "SELECT %s, %s FROM products" % (
+        ", ".join(SNAPSHOT_COLUMNS), CHECKSUM)
+    if ids is None:
+        return read_sql(query + ";", cnx)
+
+    parts = [pd.DataFrame(columns=SNAPSHOT_COLUMNS + ["CHECKSUM"])]
+    for start in range(0, len(ids), ID_BATCH):
+        batch = list(ids[start:start + ID_BATCH])
+        parts.append(read_sql("%s WHERE ID IN (%s);" %
+            (query, ", ".join([placeholder()] * len(batch))), cnx, batch))
+    return pd.concat(parts, ignore_index=True)
+
+def load_products(path, columns, full=False):
+    """
+    `columns` of `products` from local snapshot at `path`.
+    Only rows whose checksum changed (or new rows) are fetched from
+    MySQL, deleted rows are dropped. `full` refetches the whole table.
+    Checksums are compared on the memory map, then the kept rows are
+    loaded into memory once: the decision needs the whole frame.
+    """
+    cnx = connect()
+    try:
+        if full or not op.exists(path):
+            snapshot = fetch_rows(cnx)
+            logging.info("%-30s%d" % ("Snapshot rows fetched:",
+                                      snapshot.shape[0]))
+        else:
+            import pyarrow as pa
+
+            table = read_snapshot(path)
+            stored = table.select(["ID", "CHECKSUM"]).to_pandas()
+            checksums = read_sql(
+                "SELECT ID, %s FROM products;" % CHECKSUM, cnx)
+
+            known = checksums.merge(stored, on=["ID", "CHECKSUM"],
+                                    how="left", indicator=True)
+            changed = known.loc[known["_merge"] == "left_only", "ID"]
+            kept = stored["ID"].isin(checksums["ID"]) & \
+                   ~stored["ID"].isin(changed)
+            logging.info("%-30s%d" % ("Snapshot rows changed:",
+                                      changed.shape[0]))
+            logging.info("%-30s%d" % ("Snapshot rows deleted:",
+                (~stored["ID"].isin(checksums["ID"])).sum()))
+
+            snapshot = pd.concat([
+                table.filter(pa.array(kept.values)).to_pandas(),
+                fetch_rows(cnx, changed.tolist())], ignore_index=True)
+            # Map released before the file is replaced
+            del table
+    finally:
+        cnx.close()
+
+    write_snapshot(snapshot, path)
+    logging.info("%-30s%d" % ("Items in products:", snapshot.shape[0]))
+    return snapshot[columns]
@@ -0,0 +1,92 @@
+""" `products` matching the keys of update rows, read on the server
+
+Only products sharing `REFERENCE`, `CODE` or `NAME` with an update row
+are read, and the rows are decided on them as on the whole table
+(`decide_indexed`), so decisions & logs are the same. Keys are looked
+up by index in the form the updater writes them (plain digits).
+Products with `REFERENCE` or `CODE` stored otherwise (leading zeros,
+"....0", spaces) are found by one scan and compared after the same
+normalization as in memory (`schema.integer_codes`).
+"""
+import logging
+
+import pandas as pd
+
+from .db_connect import transaction, read_sql, placeholder, dialect
+from .inserter import decide_indexed
+from .schema import integer_codes, products_frame
+
+PRODUCT_COLUMNS = ["ID", "REFERENCE", "CODE", "NAME", "PRICEBUY",
+                   "PRICESELL"]
+# Key values per `IN (...)` list
+KEY_BATCH = 1000
+# Keys not stored as plain digits
+ODD_KEYS = {
+    "mysql": """REFERENCE NOT REGEXP '^[1-9][0-9]*$'
+        OR CODE NOT REGEXP '^[1-9][0-9]*$'""",
+    "sqlite": """REFERENCE NOT GLOB '[1-9]*' OR REFERENCE GLOB '*[^0-9]*'
+        OR CODE NOT GLOB '[1-9]*' OR CODE GLOB '*[^0-9]*'""",
+}
+# SQLite has no row locks, its write lock is taken at `BEGIN IMMEDIATE`
+FOR_UPDATE = {"mysql": " FOR UPDATE", "sqlite": ""}
+
+def odd_keys(cnx=None):
+    """ `ID`, `REFERENCE` & `CODE` of products with keys not plain digits """
+    return read_sql("SELECT ID, REFERENCE, CODE FROM products WHERE %s;" %
+                    ODD_KEYS[dialect()], cnx)
+
+def select_in(columns, values, cnx, lock=False):
+    """
+    Products where one of `columns` is in its list of `values`,
+    in batches of `KEY_BATCH` values. `lock` - `SELECT ... FOR UPDATE`
+    """
+    parts = [pd.DataFrame(columns=PRODUCT_COLUMNS)]
+    batches = max([-(-len(column_values) // KEY_BATCH)
+                   for column_values in values] + [0])
+    for batch in range(batches):
+        lists = [column_values[batch * KEY_BATCH:(batch + 1) * KEY_BATCH]
+                 for column_values in values]
+        where = " OR ".join("%s IN (%s)" % (col, ", ".join(
+            [placeholder()] * len(batch_values)))
+            for col, batch_values in zip(columns, lists) if batch_values)
+        query = "SELECT %s FROM products WHERE %s%s;" % (
+            ", ".join(PRODUCT_COLUMNS), where,
+            FOR_UPDATE[dialect()] if lock else "")
+        parts.append(read_sql(query, cnx, [value for batch_values in lists
+                                           for value in batch_values]))
+    return pd.concat(parts, ignore_index=True)
+
+def match_products(update, cnx, odd=None, lock=False):
+    """
+    Typed products matching `REFERENCE`, `CODE` or `NAME` of `update`.
+    `odd`  - `odd_keys` read before, e.g. once for all chunks of a file
+    `lock` - matched rows stay locked until the end of the transaction
+    """
+    if odd is None:
+        odd = odd_keys(cnx)
+    references = update["REFERENCE"].astype("int64")
+    codes = update["CODE"].dropna().astype("int64")
+    odd_ids = odd.loc[
+        integer_codes(odd["REFERENCE"]).isin(references.values).fillna(False)
+        | integer_codes(odd["CODE"]).isin(codes.values).fillna(False), "ID"]
+
+    products = select_in(
+        ["REFERENCE", "CODE", "NAME", "ID"],
+        [references.astype(str).unique().tolist(),
+         codes.astype(str).unique().tolist(),
+         update["NAME"].astype(str).unique().tolist(),
+         odd_ids.tolist()], cnx, lock)
+    # Rows matching several keys are read more than once
+    products = products.drop_duplicates("ID").reset_index(drop=True)
+    return products_frame(products)
+
+def decide_on_server(update, paths, append=False, odd=None):
+    """
+    `decide_indexed` on the products matching keys of `update` instead
+    of the whole table. `append` adds decided rows to existing logs,
+    `odd` is passed to `match_products`.
+    """
+    with transaction() as cnx:
+        products = match_products(update, cnx, odd)
+    logging.info("%-30s%d" % ("Matched products:", products.shape[0]))
+    return decide_indexed(update, products, paths, append=append)
@@ -0,0 +1,48 @@
+import os
+import os.path as op
+import logging
+
+import numpy as np
+import pandas as pd
+
+from .consistency_checker import read_update, name_column, key_hashes
+
+KEY_COLUMNS = ("ean", "id", "p_NAME", )
+
+def duplicate_keys(path, chunksize):
+    """
+    First pass over update file in chunks of `chunksize` rows.
+    Returns {column: sorted hashes of values found more than once}
+    for `ean`, `id` & `p_NAME`, as `duplicated(keep=False)` over the
+    whole file would flag them. Holds one 8 byte hash per distinct
+    value of a chunk, never the rows themselves.
+    """
+    parts = {col: [] for col in KEY_COLUMNS}
+    rows = 0
+    for chunk in read_update(path, chunksize):
+        chunk["p_NAME"] = name_column(chunk)
+        for col in KEY_COLUMNS:
+            keys, counts = np.unique(key_hashes(chunk[col]),
+                                     return_counts=True)
+            # Keys twice in a chunk are kept twice
+            parts[col].append(np.concatenate([keys, keys[counts > 1]]))
+        rows += chunk.shape[0]
+    logging.info("%-30s%d" % ("Input rows:", rows))
+
+    dup_keys = dict()
+    for col, keys in parts.items():
+        keys, counts = np.unique(np.concatenate(keys or [[]])
+                                 .astype(np.uint64), return_counts=True)
+        dup_keys[col] = keys[counts > 1]
+        logging.info("%-30s%d" % ("Duplicated %s values:" % col,
+                                  dup_keys[col].shape[0]))
+    return dup_keys
+
+def spill(data, folder, number):
+    """ Saves decided chunk `number` into `folder` """
+    data.to_pickle(op.join(folder, "%06d.pkl" % number))
+
+def iter_spilled(folder):
+    """ Decided chunks saved by `spill` in order """
+    for file in sorted(os.listdir(folder)):
+        yield pd.read_pickle(op.join(folder, file))